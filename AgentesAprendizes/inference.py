@@ -0,0 +1,182 @@
+"""Representacao compacta, so para inferencia, das redes de nn_alunos.py.
+
+Uma rede compacta e um dicionario com nx, nz, ny, o tipo dos pesos ('float32' ou 'int8') e
+wzx/wyz num array desse tipo. Em int8 cada linha de pesos (os pesos de entrada de uma unidade,
+incluindo o do bias) e quantizada com a sua propria escala, max|w| / 127, guardada em szx/syz
+(float32); o peso original e aproximadamente q * escala.
+
+    compact          converte uma rede treinada (de qualquer backend)
+    forward_compact  saidas da rede compacta para uma matriz de padroes (em float32)
+    predict_compact  classe escolhida para cada padrao, com a mesma regra de retranslate
+    decisions        classes ('edible'/'poisonous') dadas por retranslate as saidas de uma rede
+    reference_decisions  as mesmas classes para a rede original, com forward padrao a padrao
+    mismatches       padroes em que a rede compacta decide de forma diferente da original
+    compact_checked  a versao mais compacta que decide como a original em todos os padroes dados
+    memory_bytes     memoria ocupada pelos pesos (para listas de Python conta tambem os floats)
+
+A rede compacta nao pode ser treinada (nao tem x, z, dz, ...).
+
+O bloco __main__ treina redes para varios tamanhos da camada escondida (ou le redes gravadas com
+save_net), converte-as e mostra, para cada representacao, a memoria dos pesos, o numero de
+decisoes diferentes das da rede original no conjunto de teste e as previsoes por segundo.
+
+Exemplo:
+    python inference.py --hidden 4 7 11 --epochs 2 --train 2000
+    python inference.py --model rede.net
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+import nn_alunos as nn
+
+dtypes = ('float32', 'int8')
+
+
+def _quantize(w):
+    """Quantiza cada linha de w para int8 com escala max|linha| / 127; devolve (q, escalas)"""
+    maximo = np.abs(w).max(axis=1)
+    escala = np.where(maximo > 0, maximo / 127.0, 1.0)
+    q = np.rint(w / escala[:, None]).astype(np.int8)
+    return q, escala.astype(np.float32)
+
+
+def compact(net, dtype='float32'):
+    wzx = np.asarray(net['wzx'], dtype=np.float64)
+    wyz = np.asarray(net['wyz'], dtype=np.float64)
+    cnet = {'nx': net['nx'], 'nz': net['nz'], 'ny': net['ny'], 'dtype': dtype}
+    if dtype == 'float32':
+        cnet['wzx'] = wzx.astype(np.float32)
+        cnet['wyz'] = wyz.astype(np.float32)
+    elif dtype == 'int8':
+        cnet['wzx'], cnet['szx'] = _quantize(wzx)
+        cnet['wyz'], cnet['syz'] = _quantize(wyz)
+    else:
+        raise ValueError("tipo de pesos desconhecido: %r (esperado um de %s)" % (dtype, ', '.join(dtypes)))
+    return cnet
+
+
+def _weights(cnet, nome):
+    w = cnet[nome].astype(np.float32)
+    if cnet['dtype'] == 'int8':
+        w *= cnet['s' + nome[1:]][:, None]
+    return w
+
+
+def forward_compact(cnet, X):
+    """Saidas (uma linha por padrao de X) da rede compacta, calculadas em float32.
+    Os pesos int8 sao convertidos linha a linha com as escalas em cada chamada, pelo que so a forma
+    compacta fica em memoria entre chamadas"""
+    X = np.asarray(X, dtype=np.float32)
+    wzx = _weights(cnet, 'wzx')
+    wyz = _weights(cnet, 'wyz')
+    #os pesos do bias multiplicam sempre -1, tal como em predict_many
+    z = nn.sig_np(X @ wzx[:, :-1].T - wzx[:, -1])
+    return nn.sig_np(z @ wyz[:, :-1].T - wyz[:, -1])
+
+
+def predict_compact(cnet, X):
+    """Indice da classe escolhida para cada padrao; em caso de empate a ultima saida, como em retranslate"""
+    y = forward_compact(cnet, X)
+    return y.shape[1] - 1 - np.argmax(y[:, ::-1], axis=1)
+
+
+def decisions(saidas):
+    return [nn.retranslate(y) for y in saidas]
+
+
+def reference_decisions(net, X):
+    """Decisoes da rede original, padrao a padrao, com forward e retranslate (altera net['x'], net['z'], net['y'])"""
+    resultado = []
+    for inp in np.asarray(X).tolist():
+        nn.forward(net, inp)
+        resultado.append(nn.retranslate(net['y']))
+    return resultado
+
+
+def mismatches(net, cnet, X):
+    """Indices dos padroes de X em que a rede compacta cnet decide de forma diferente da rede original"""
+    original = reference_decisions(net, X)
+    return [i for i, (a, b) in enumerate(zip(original, decisions(forward_compact(cnet, X)))) if a != b]
+
+
+def compact_checked(net, X, order=('int8', 'float32')):
+    """A primeira versao compacta (pela ordem indicada, da mais pequena para a maior) que toma exactamente
+    as mesmas decisoes que net em todos os padroes de X; None se nenhuma o fizer"""
+    for dtype in order:
+        cnet = compact(net, dtype)
+        if not mismatches(net, cnet, X):
+            return cnet
+    return None
+
+
+def memory_bytes(net):
+    """Bytes ocupados por wzx e wyz (e pelas escalas, numa rede int8). Para redes com listas de Python
+    conta as listas e cada float, que e um objecto proprio"""
+    total = 0
+    for nome in ('wzx', 'wyz', 'szx', 'syz'):
+        w = net.get(nome)
+        if w is None:
+            continue
+        if isinstance(w, np.ndarray):
+            total += w.nbytes
+        else:
+            total += sys.getsizeof(w) + sum(sys.getsizeof(linha) + sum(sys.getsizeof(v) for v in linha) for linha in w)
+    return total
+
+
+def _per_sec(fn, X, min_time=0.2):
+    chamadas = 0
+    inicio = time.perf_counter()
+    while True:
+        fn(X)
+        chamadas += 1
+        decorrido = time.perf_counter() - inicio
+        if decorrido >= min_time:
+            return chamadas * len(X) / decorrido
+
+
+def report(nome, net, X, min_time=0.2):
+    """Compara a rede net com as suas versoes compactas no conjunto X e devolve uma linha por versao"""
+    linhas = [{'rede': nome, 'tipo': 'float64 (%s)' % net['backend'], 'bytes': memory_bytes(net), 'diferentes': 0,
+               'previsoes_s': _per_sec(lambda A: nn.predict_many(net, A), X, min_time)}]
+    for dtype in dtypes:
+        cnet = compact(net, dtype)
+        linhas.append({'rede': nome, 'tipo': dtype, 'bytes': memory_bytes(cnet), 'diferentes': len(mismatches(net, cnet, X)),
+                       'previsoes_s': _per_sec(lambda A: predict_compact(cnet, A), X, min_time)})
+    return linhas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='mushrooms.csv')
+    parser.add_argument('--model', nargs='*', default=[], help='redes gravadas com save_net (em vez de treinar)')
+    parser.add_argument('--hidden', type=int, nargs='+', default=[4, 7, 11])
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--train', type=int, default=2000)
+    parser.add_argument('--test', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    train_set, test_set = nn.build_sets(args.csv, args.train, args.test)
+    X_test, _ = nn.patterns_to_arrays(test_set)
+
+    redes = [(modelo, nn.load_net(modelo, mmap=False)) for modelo in args.model]
+    if not redes:
+        for hidden in args.hidden:
+            random.seed(args.seed)
+            redes.append(('hidden=%d' % hidden, nn.train_mushrooms(nn.encoded_input_size(), hidden, 2, train_set, test_set,
+                                                                   args.epochs, 10, headless=True, sparse=True)))
+
+    print("| {:<12} | {:<16} | {:>9} | {:>10} | {:>12} |".format('rede', 'pesos', 'bytes', 'diferentes', 'previsoes/s'))
+    for nome, net in redes:
+        for l in report(nome, net, X_test):
+            print("| {:<12} | {:<16} | {:>9} | {:>10} | {:>12.0f} |".format(
+                l['rede'], l['tipo'], l['bytes'], l['diferentes'], l['previsoes_s']))
+        escolhida = compact_checked(net, X_test)
+        print("%s: %s" % (nome, 'usar ' + escolhida['dtype'] if escolhida else 'nenhuma versao compacta decide como a original'))
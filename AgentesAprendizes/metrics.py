@@ -0,0 +1,140 @@
+"""Registo de metricas do treino (precisao ao longo das iteracoes) desacoplado do ciclo de treino.
+
+Um recorder e um dicionario com uma lista de sinks e as regras de amostragem:
+    every         so aceita um registo de every em every iteracoes
+    min_interval  e pelo menos min_interval segundos depois do ultimo registo aceite
+    buffer_size   os registos sao entregues aos sinks em grupos deste tamanho
+
+Um sink e um dicionario com duas funcoes: 'emit', que recebe uma lista de registos
+(dicionarios com 'step' e os valores medidos), e 'close', chamada no fim do treino.
+Estao disponiveis plot_sink (grafico matplotlib actualizado em tempo real),
+stdout_sink e file_sink (CSV).
+
+O ciclo de treino so pergunta ao recorder de quantas em quantas iteracoes deve medir
+(recorder_every); um recorder sem sinks devolve infinito, pelo que o treino nem chega
+a calcular as precisoes."""
+
+import csv
+import time
+
+
+def make_recorder(sinks, every=1, min_interval=0.0, buffer_size=1):
+    return {'sinks': list(sinks), 'every': max(1, every), 'min_interval': min_interval,
+            'buffer_size': max(1, buffer_size), 'buffer': [], 'last_time': float('-inf')}
+
+
+def recorder_every(rec):
+    """Intervalo de iteracoes entre medicoes; infinito quando nao ha nada para registar"""
+    if rec is None or not rec['sinks']:
+        return float('inf')
+    return rec['every']
+
+
+def due(rec, step):
+    """Indica se deve ser feita uma medicao na iteracao step (limite por tempo)"""
+    if recorder_every(rec) == float('inf'):
+        return False
+    return time.perf_counter() - rec['last_time'] >= rec['min_interval']
+
+
+def record(rec, step, **values):
+    rec['buffer'].append(dict(step=step, **values))
+    rec['last_time'] = time.perf_counter()
+    if len(rec['buffer']) >= rec['buffer_size']:
+        flush(rec)
+
+
+def flush(rec):
+    if rec['buffer']:
+        for sink in rec['sinks']:
+            sink['emit'](rec['buffer'])
+        rec['buffer'] = []
+
+
+def close(rec):
+    if rec is None:
+        return
+    flush(rec)
+    for sink in rec['sinks']:
+        sink['close']()
+
+
+def _nothing():
+    pass
+
+
+def stdout_sink(fmt=None):
+    """Escreve uma linha por registo, por exemplo 'step 600: train_accuracy=97.20 test_accuracy=96.90'"""
+    def emit(records):
+        for r in records:
+            if fmt:
+                print(fmt.format(**r))
+            else:
+                valores = ' '.join('%s=%.2f' % (k, v) for k, v in r.items() if k != 'step')
+                print('step %d: %s' % (r['step'], valores))
+    return {'emit': emit, 'close': _nothing}
+
+
+def file_sink(path):
+    """Escreve os registos num ficheiro CSV; o cabecalho vem das chaves do primeiro registo"""
+    state = {'file': None, 'writer': None}
+
+    def emit(records):
+        if state['file'] is None:
+            state['file'] = open(path, 'w', newline='')
+            state['writer'] = csv.DictWriter(state['file'], fieldnames=list(records[0]))
+            state['writer'].writeheader()
+        state['writer'].writerows(records)
+        state['file'].flush()
+
+    def close():
+        if state['file'] is not None:
+            state['file'].close()
+
+    return {'emit': emit, 'close': close}
+
+
+def plot_sink(title='Training and Testing Accuracy Over Time', block=True):
+    """Grafico com a precisao de treino e de teste ao longo das iteracoes.
+    A figura so e criada (e o matplotlib importado) quando chega o primeiro registo."""
+    state = {'steps': [], 'train': [], 'test': []}
+
+    def setup():
+        import matplotlib.pyplot as plt
+        plt.ion()
+        fig = plt.figure(figsize=(10, 6))
+        ax = fig.add_subplot(111)
+
+        # Inicializa as linhas do gráfico
+        line1, = ax.plot([], [], label='Training Accuracy', marker='o', linestyle='-', color='blue')
+        line2, = ax.plot([], [], label='Test Accuracy', marker='x', linestyle='--', color='orange')
+        ax.set_xlabel('Step', fontsize=12)
+        ax.set_ylabel('Accuracy', fontsize=12)
+        ax.set_title(title, fontsize=14)
+        ax.legend(fontsize=12, loc='upper right')
+        ax.grid(axis='y', linestyle='--')
+        ax.set_ylim([0, 100])
+        state.update(plt=plt, ax=ax, line1=line1, line2=line2)
+
+    def emit(records):
+        if 'plt' not in state:
+            setup()
+        for r in records:
+            state['steps'].append(r['step'])
+            state['train'].append(r.get('train_accuracy'))
+            state['test'].append(r.get('test_accuracy'))
+
+        # Atualiza os dados das linhas
+        state['line1'].set_data(state['steps'], state['train'])
+        state['line2'].set_data(state['steps'], state['test'])
+        state['ax'].relim()  # Recalcula os limites dos eixos
+        state['ax'].autoscale_view()  # Ajusta a visualização aos novos limites
+        state['plt'].pause(0.001)
+
+    def close():
+        if 'plt' in state:
+            state['plt'].ioff()
+            if block:
+                state['plt'].show()
+
+    return {'emit': emit, 'close': close}
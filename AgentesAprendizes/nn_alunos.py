@@ -2,20 +2,37 @@
 
 import random
 import math
+import contextlib
 import csv
-import matplotlib.pyplot as plt
+import glob
+import hashlib
+import os
+import struct
+import zlib
+import numpy as np
+
+import metrics
+import pipeline
 
 #valor exemplificativo para a velocidade de aprendizagem (tambem lhe podíamos ter chamado new)
 alpha = 0.2
 
+#Fase medida pelo profiler prof (ver profiling.py na raiz do repositorio); sem profiler nao mede nada
+def _phase(prof, nome):
+    return prof['phase'](nome) if prof else contextlib.nullcontext()
+
 #------------------CÓDIGO GENÉRICO PARA CRIAR, TREINAR E USAR UMA REDE COM UMA CAMADA ESCONDIDA------------
 """Funcao que cria, inicializa e devolve uma rede neuronal, incluindo
 a criacao das diversos listas, bem como a inicializacao das listas de pesos. 
 Note-se que sao incluidas duas unidades extra, uma de entrada e outra escondida, 
 mais os respectivos pesos, para lidar com os tresholds; note-se tambem que, 
 tal como foi discutido na teorica, as saidas destas estas unidades estao sempre a -1.
-Por exemplo, a chamada make(3, 5, 2) cria e devolve uma rede 3x5x2"""
-def make(nx, nz, ny):
+Por exemplo, a chamada make(3, 5, 2) cria e devolve uma rede 3x5x2.
+Com backend='numpy' os pesos sao guardados em arrays (nz x nx+1 e ny x nz+1) e
+as funcoes forward, error e update usam operacoes matriciais em vez de listas;
+os pesos iniciais sao sorteados pela mesma ordem, pelo que para a mesma semente
+as duas versoes dao os mesmos resultados (a menos de erros de virgula flutuante)"""
+def make(nx, nz, ny, backend='list'):
     #a rede neuronal é um dicionario com as seguintes chaves:
     # nx     numero de entradas
     # nz     numero de unidades escondidas
@@ -27,20 +44,70 @@ def make(nx, nz, ny):
     # wyz    array de pesos entre a camada escondida e a camada de saida
     # dz     array de erros das unidades escondidas
     # dy     array de erros das unidades de saida    
+    # backend 'list' (listas de Python) ou 'numpy' (arrays)
     
-    nn = {'nx':nx, 'nz':nz, 'ny':ny, 'x':[], 'z':[], 'y':[], 'wzx':[], 'wyz':[], 'dz':[], 'dy':[]}
+    nn = {'nx':nx, 'nz':nz, 'ny':ny, 'x':[], 'z':[], 'y':[], 'wzx':[], 'wyz':[], 'dz':[], 'dy':[], 'backend':backend}
     
     nn['wzx'] = [[random.uniform(-0.5,0.5) for _ in range(nn['nx'] + 1)] for _ in range(nn['nz'])]
     nn['wyz'] = [[random.uniform(-0.5,0.5) for _ in range(nn['nz'] + 1)] for _ in range(nn['ny'])]
+
+    if backend == 'numpy':
+        nn['wzx'] = np.array(nn['wzx'], dtype=np.float64)
+        nn['wyz'] = np.array(nn['wyz'], dtype=np.float64)
+    elif backend != 'list':
+        raise ValueError("backend desconhecido: %r" % (backend,))
     return nn
 
-#Funcao de activacao (sigmoide)
+#Funcao de activacao (sigmoide); para entradas muito negativas (< -709) math.exp(-inp) nao cabe num float
+#e a sigmoide e 0 (a menos de 1e-308)
 def sig(inp):
-    return 1.0/(1.0 + math.exp(-inp))
+    try:
+        return 1.0/(1.0 + math.exp(-inp))
+    except OverflowError:
+        return 0.0
+
+#Versao vectorizada da sigmoide, aplicada elemento a elemento a um array (np.exp da infinito em vez de
+#lancar OverflowError, e 1/(1+inf) = 0, pelo que so e preciso calar o aviso)
+def sig_np(inp):
+    with np.errstate(over='ignore'):
+        return 1.0/(1.0 + np.exp(-inp))
+
+"""Modos de activacao. forward, forward_batch, predict_many, etc. usam sempre sig e sig_np;
+set_activation substitui estas duas funcoes (ao nivel do modulo) pelas do modo escolhido:
+    'exact'  a sigmoide calculada com exp
+    'clip'   a sigmoide dura 0.5 + x/4 cortada a [0, 1] (a recta tangente a sigmoide em 0), sem exp
+O modo actual fica em activation. Uma rede treinada num modo deve ser usada no mesmo modo.
+Medido nesta maquina: sozinha, a sigmoide 'clip' custa cerca de 0.08us por chamada contra 0.12us da
+'exact' (200 000 chamadas: 0.017s contra 0.024s), mas em benchmark.py --only act (hidden=11) forward,
+iterate_sparse e predict_many ficam dentro do ruido entre execucoes (+-20%), porque as somas pesam muito
+mais do que as 13 chamadas a sig; a precisao de teste fica a 0.1 pontos da 'exact'. Uma tabela da
+sigmoide com interpolacao foi experimentada e posta de parte: em Python puro, mesmo com um so indice e
+uma multiplicacao-soma, custa cerca de 1.7x o math.exp, e np.interp e varias vezes mais lento do que np.exp"""
+activation = 'exact'
+_sig_exact, _sig_np_exact = sig, sig_np
+
+def _sig_clip(inp):
+    return 0.0 if inp <= -2.0 else (1.0 if inp >= 2.0 else 0.5 + 0.25*inp)
+
+def _sig_np_clip(inp):
+    return np.clip(0.5 + 0.25*inp, 0.0, 1.0)
+
+def set_activation(mode='exact'):
+    global sig, sig_np, activation
+    if mode == 'exact':
+        sig, sig_np = _sig_exact, _sig_np_exact
+    elif mode == 'clip':
+        sig, sig_np = _sig_clip, _sig_np_clip
+    else:
+        raise ValueError("activacao desconhecida: %r" % (mode,))
+    activation = mode
 
 """Função que recebe uma rede nn e um padrao de entrada inp (uma lista) 
 e faz a propagacao da informacao para a frente ate as saidas"""
 def forward(nn, inp):
+    if nn['backend'] == 'numpy':
+        return _forward_np(nn, inp)
+
     #copia a informacao do vector de entrada in para a listavector de inputs da rede nn  
     nn['x']=inp.copy()
     nn['x'].append(-1)
@@ -51,29 +118,143 @@ def forward(nn, inp):
     
     #calcula a activacao da unidades de saida
     nn['y']=[sig(sum([z*w for z, w in zip(nn['z'], nn['wyz'][i])])) for i in range(nn['ny'])]
+
+def _forward_np(nn, inp):
+    #o -1 no fim do vector de entrada e do vector escondido corresponde ao bias
+    nn['x'] = np.append(np.asarray(inp, dtype=np.float64), -1.0)
+    nn['z'] = np.append(sig_np(nn['wzx'] @ nn['x']), -1.0)
+    nn['y'] = sig_np(nn['wyz'] @ nn['z'])
  
 """Funcao que recebe uma rede nn com as activacoes calculadas e a lista output de saidas pretendidas e calcula os erros
 na camada escondida e na camada de saida"""
 def error(nn, output):
+    if nn['backend'] == 'numpy':
+        return _error_np(nn, output)
+
     nn['dy']=[y*(1-y)*(o-y) for y,o in zip(nn['y'], output)]
     
     zerror=[sum([nn['wyz'][i][j]*nn['dy'][i] for i in range(nn['ny'])]) for j in range(nn['nz'])]
     
     nn['dz']=[z*(1-z)*e for z, e in zip(nn['z'], zerror)]
+
+def _error_np(nn, output):
+    y = nn['y']
+    nn['dy'] = y*(1-y)*(np.asarray(output, dtype=np.float64) - y)
+
+    #o erro nao se propaga para a unidade de bias (ultima coluna de wyz)
+    z = nn['z'][:nn['nz']]
+    nn['dz'] = z*(1-z)*(nn['wyz'][:, :nn['nz']].T @ nn['dy'])
  
 """Funcao que recebe uma rede com as activacoes e erros calculados e actualiza as listas de pesos"""
 def update(nn):
+    if nn['backend'] == 'numpy':
+        #actualizacao in-place com o produto externo erro x activacao
+        nn['wzx'] += alpha * np.outer(nn['dz'], nn['x'])
+        nn['wyz'] += alpha * np.outer(nn['dy'], nn['z'])
+        return
+
     nn['wzx'] = [[w+x*nn['dz'][i]*alpha for w, x in zip(nn['wzx'][i], nn['x'])] for i in range(nn['nz'])]
     nn['wyz'] = [[w+z*nn['dy'][i]*alpha for w, z in zip(nn['wyz'][i], nn['z'])] for i in range(nn['ny'])]
     
 """Funcao que realiza uma iteracao de treino para um dado padrao de entrada inp com saida desejada output"""
-def iterate(i, nn, inp, output, ):
+def iterate(i, nn, inp, output, printing=True):
       forward(nn, inp)
       error(nn, output)
       update(nn)
-      print('%03i: %s -----> %s : %s' %(i, inp, output, nn['y']))
-
+      if printing:
+          print('%03i: %s -----> %s : %s' %(i, inp, output, nn['y']))
+
+
+"""Versoes em lote (mini-batch) de forward, error e update para redes criadas com backend='numpy'.
+X e uma matriz com um padrao de entrada por linha e T a matriz das saidas pretendidas;
+nn['x'], nn['z'], nn['y'], nn['dz'] e nn['dy'] passam a ter uma linha por padrao"""
+def forward_batch(nn, X):
+    X = np.asarray(X, dtype=np.float64)
+    bias = np.full((X.shape[0], 1), -1.0)
+    nn['x'] = np.hstack((X, bias))
+    nn['z'] = np.hstack((sig_np(nn['x'] @ nn['wzx'].T), bias))
+    nn['y'] = sig_np(nn['z'] @ nn['wyz'].T)
+
+def error_batch(nn, T):
+    y = nn['y']
+    nn['dy'] = y*(1-y)*(np.asarray(T, dtype=np.float64) - y)
+    z = nn['z'][:, :nn['nz']]
+    nn['dz'] = z*(1-z)*(nn['dy'] @ nn['wyz'][:, :nn['nz']])
+
+"""Actualiza os pesos com a media das correccoes de todos os padroes do lote"""
+def update_batch(nn):
+    n = nn['x'].shape[0]
+    nn['wzx'] += (alpha / n) * (nn['dz'].T @ nn['x'])
+    nn['wyz'] += (alpha / n) * (nn['dy'].T @ nn['z'])
+
+"""Iteracao de treino com um lote de padroes X e respectivas saidas desejadas T"""
+def iterate_batch(nn, X, T):
+    forward_batch(nn, X)
+    error_batch(nn, T)
+    update_batch(nn)
+
+
+
+"""Versoes esparsas de forward e update para entradas one-hot (cada padrao dos cogumelos tem exactamente
+um 1 por atributo, 22 em 126). A entrada e dada pelos indices das entradas activas (ver active_indices):
+a activacao de cada unidade escondida e a soma das colunas de wzx desses indices menos o peso do bias,
+e a actualizacao so mexe nessas colunas e na do bias. O erro e calculado com error/error_batch, que nao
+dependem da entrada. Os indices activos ficam em nn['xi'].
+So o backend de listas ganha com isto (cerca de 6x por padrao): com numpy, juntar as colunas com
+indexacao avancada e mais lento do que o produto denso, pelo que a rede numpy reconstroi o vector 0/1
+e usa forward/update (o ganho fica apenas em guardar os padroes como indices).
+Para uma entrada 0/1 os resultados sao os mesmos que os de forward/update (a menos da ordem das somas)"""
+def forward_sparse(nn, idx):
+    nn['xi'] = idx
+    if nn['backend'] == 'numpy':
+        return _forward_np(nn, dense_from_indices([idx], nn['nx'])[0])
+
+    nn['z'] = [sig(sum([w[j] for j in idx]) - w[-1]) for w in nn['wzx']]
+    nn['z'].append(-1)
+    nn['y'] = [sig(sum([z*w for z, w in zip(nn['z'], nn['wyz'][i])])) for i in range(nn['ny'])]
+
+def update_sparse(nn):
+    if nn['backend'] == 'numpy':
+        return update(nn)
+
+    idx = nn['xi']
+    for i, w in enumerate(nn['wzx']):
+        passo = alpha * nn['dz'][i]
+        for j in idx:
+            w[j] += passo
+        w[-1] -= passo
+    nn['wyz'] = [[w+z*nn['dy'][i]*alpha for w, z in zip(nn['wyz'][i], nn['z'])] for i in range(nn['ny'])]
 
+def iterate_sparse(nn, idx, output):
+    forward_sparse(nn, idx)
+    error(nn, output)
+    update_sparse(nn)
+
+"""Iteracao de treino com um lote dado pelos indices activos I (um padrao por linha), para conjuntos
+guardados so como indices (ver active_indices e stream_csv). O lote e convertido uma vez na matriz 0/1
+e treinado com iterate_batch: em lotes, o produto de matrizes denso e mais rapido do que juntar ou
+acumular colunas"""
+def iterate_batch_sparse(nn, I, T):
+    iterate_batch(nn, dense_from_indices(I, nn['nx']), T)
+
+"""Matriz 0/1 (float64) com nx colunas e um 1 em cada um dos indices de cada linha de I"""
+def dense_from_indices(I, nx):
+    I = np.asarray(I)
+    X = np.zeros((I.shape[0], nx))
+    X[np.arange(I.shape[0])[:, None], I] = 1.0
+    return X
+
+"""Converte uma matriz X de padroes one-hot (0/1, uma linha por padrao) numa matriz de inteiros com os
+indices das entradas activas de cada linha. Todas as linhas tem de ter o mesmo numero de entradas activas
+(um valor por atributo); caso contrario e lancado ValueError"""
+def active_indices(X):
+    X = np.asarray(X)
+    activos = X.sum(axis=1)
+    if len(X) and (activos != activos[0]).any():
+        raise ValueError("os padroes tem numeros diferentes de entradas activas (%d a %d)" % (activos.min(), activos.max()))
+    k = int(activos[0]) if len(X) else 0
+    dtype = np.int16 if X.shape[1] <= np.iinfo(np.int16).max else np.int32
+    return np.nonzero(X)[1].reshape(len(X), k).astype(dtype)
 
 #-------------------------CÓDIGO QUE IRÁ PERMITIR CRIAR UMA REDE PARA APRENDER A CLASSIFICAR COGUMELOS---------  
 
@@ -128,69 +309,163 @@ dicionario = {0 : {'b':0, 'c': 1, 'x':2, 'f': 3, 'k': 4, 's':5}, #cap-shape: bel
 a funcao que cria e treina a rede e, por fim, a funcao que a testa.
 A funcao recebe como argumento o ficheiro correspondente ao dataset que deve ser usado, os tamanhos das camadas de entrada, escondida e saída,
 o numero de epocas que deve ser considerado no treino, os tamanhos do conjunto de treino e teste e 
-o intervalo de iterações """
-def run_mushrooms(file, input_size, hidden_size, output_size, epochs, training_set_size, test_set_size, print_step):
-    train_set, test_set = build_sets(file, training_set_size, test_set_size)
+o intervalo de iterações. batch_size indica quantos padroes sao usados em cada actualizacao dos pesos
+(1 corresponde ao treino padrao a padrao), headless=True desliga o grafico e as mensagens e recorder
+permite escolher para onde vao as metricas do treino (ver train_mushrooms).
+Com um profiler (prof) e medido o tempo de cada fase: criacao dos conjuntos, treino e teste final.
+Se save for um caminho, a rede treinada e gravada nesse ficheiro com save_net; sparse=True usa o treino
+com entradas esparsas e order escolhe a ordem dos padroes em cada epoca (ver train_mushrooms).
+Devolve a precisao final no conjunto de teste"""
+def run_mushrooms(file, input_size, hidden_size, output_size, epochs, training_set_size, test_set_size, print_step, batch_size=1, headless=False, recorder=None, prof=None, save=None, sparse=False, order='fixed'):
+    with _phase(prof, 'build_sets'):
+        train_set, test_set = build_sets(file, training_set_size, test_set_size, printing=not headless)
 
     if not train_set or not test_set:
         print("Erro na criação dos conjuntos de treino e teste")
         return
 
     print_step = int((training_set_size * epochs) / 100)
-    trained_nn = train_mushrooms(input_size, hidden_size, output_size, train_set, test_set, epochs, print_step)
+    with _phase(prof, 'train_mushrooms'):
+        trained_nn = train_mushrooms(input_size, hidden_size, output_size, train_set, test_set, epochs, print_step, batch_size, headless, recorder, prof, sparse, order)
+    if save:
+        save_net(trained_nn, save)
 
     # Teste final da rede treinada
-    print("\nTeste final da rede treinada:")
-    test_mushrooms(trained_nn, test_set)
+    if not headless:
+        print("\nTeste final da rede treinada:")
+    with _phase(prof, 'test_mushrooms'):
+        return test_mushrooms(trained_nn, test_set, printing=not headless)
 
 
     
 
 """Funcao que cria os conjuntos de treino e de de teste a partir dos dados
-armazenados em f (mushrooms.csv). A funcao le cada linha, tranforma-a numa lista de valores e 
-chama a funcao translate para a colocar no formato adequado para o padrao de treino. 
-Estes padroes são colocados numa lista.
+armazenados em f (mushrooms.csv). Os padroes codificados sao obtidos com load_dataset, que so le
+o CSV e chama a funcao translate para cada linha quando a cache binaria nao existe ou esta desactualizada.
 A função recebe como argumentos o nº de exemplos que devem ser considerados no conjunto de treino --->x e
 o nº de exemplos que devem ser considerados no conjunto de teste ------> y
 Finalmente, devolve duas listas, uma com x padroes (conjunto de treino)
-e a segunda com y padrões (conjunto de teste). Atenção que x+y não pode ultrapassar o nº de cogumelos 
-disponível no dataset"""
-  # Listas para armazenar os padrões de treino e teste
-def build_sets(f, x, y):
-   
-    train_set = []
-    test_set = []
+e a segunda com y padrões (conjunto de teste), no formato devolvido por translate.
+Atenção que x+y não pode ultrapassar o nº de cogumelos disponível no dataset.
+Com printing=False a mensagem de sucesso nao e mostrada (os erros sao sempre mostrados)"""
+def build_sets(f, x, y, printing=True):
 
     try:
-        with open(f, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            next(reader)  
-            
-            # Lista temporária para armazenar todos os padrões antes de dividir em treino e teste
-            all_patterns = []
-            
-          
-            for row in reader:
-                # Converte a linha lida do CSV em um padrão de treino usando a função translate
-                pattern = translate(row)
-                all_patterns.append(pattern)
-            
-            # Embaralhar a lista de padrões para garantir a aleatoriedade
-            random.shuffle(all_patterns)
-            
-            # Dividir os padrões em conjuntos de treino e teste
-            train_set = all_patterns[:x]
-            test_set = all_patterns[x:x + y]
-            
+        X, labels = load_dataset(f)
+
+        # Embaralhar os indices dos padrões para garantir a aleatoriedade
+        indices = list(range(len(X)))
+        random.shuffle(indices)
+
+        def pattern(i):
+            classe = 'p' if labels[i] else 'e'
+            return [X[i].tolist(), classe, [0, 1] if labels[i] else [1, 0]]
+
+        # Dividir os padrões em conjuntos de treino e teste
+        train_set = [pattern(i) for i in indices[:x]]
+        test_set = [pattern(i) for i in indices[x:x + y]]
+
+        if printing:
             print("Conjuntos de treinamento e teste criados com sucesso!")
-            return train_set, test_set
+        return train_set, test_set
 
     except Exception as e:
         print("Erro ao abrir ou processar o arquivo '{}':".format(f), e)
         return None, None
+
+
+#datasets ja carregados neste processo, indexados pelo caminho do ficheiro de cache
+_datasets = {}
+
+"""Devolve o dataset f codificado como um par (X, labels): X e uma matriz uint8 de 0/1 com um padrao de
+entrada por linha e labels um vector com 0 (edible) ou 1 (poisonous).
+A primeira vez, o CSV e codificado com translate e guardado ao lado de f num ficheiro .npy com os bits
+de cada linha empacotados (np.packbits) e a classe na ultima coluna. Nas vezes seguintes esse ficheiro e
+aberto com memory-map. O nome da cache inclui um hash do conteudo do CSV e do dicionario, por isso
+qualquer alteracao a um deles gera uma cache nova (e as antigas sao apagadas)"""
+def load_dataset(f):
+    path = dataset_cache_path(f)
+    if path in _datasets:
+        return _datasets[path]
+
+    if not os.path.exists(path):
+        _write_dataset_cache(f, path)
+
+    packed = np.load(path, mmap_mode='r')
+    X = np.unpackbits(packed[:, :-1], axis=1, count=encoded_input_size())
+    labels = np.asarray(packed[:, -1])
+
+    _datasets[path] = (X, labels)
+    return X, labels
+
+"""Caminho do ficheiro de cache de f para o conteudo actual do CSV e do dicionario"""
+def dataset_cache_path(f):
+    h = hashlib.sha1()
+    with open(f, 'rb') as csvfile:
+        h.update(csvfile.read())
+    h.update(repr(dicionario).encode())
+    return '%s.%s.npy' % (f, h.hexdigest()[:16])
+
+def _write_dataset_cache(f, path):
+    rows = []
+    with open(f, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+        for row in reader:
+            entrada, classe, _ = translate(row)
+            rows.append(np.append(np.packbits(np.array(entrada, dtype=np.uint8)), 0 if classe == 'e' else 1))
+
+    # Remove caches antigas do mesmo CSV
+    for antiga in glob.glob(glob.escape(f) + '.*.npy'):
+        os.remove(antiga)
+
+    # Escreve primeiro num ficheiro temporario para que outro processo nunca leia uma cache incompleta
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as out:
+        np.save(out, np.array(rows, dtype=np.uint8))
+    os.replace(tmp, path)
  
  
  
+"""Numero de entradas da rede para a codificacao definida em dicionario (126 para mushrooms.csv)"""
+def encoded_input_size():
+    return sum(len(atributo) for atributo in dicionario.values())
+
+def _csv_rows(f):
+    with open(f, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)
+        yield from reader
+
+"""Le o CSV f em fluxo e devolve lotes (X, T) de batch_size padroes codificados com translate, sem nunca
+ter o ficheiro todo em memoria; o ficheiro e lido de novo em cada uma das epochs epocas.
+Com shuffle_buffer > 0 as linhas sao baralhadas com um buffer desse tamanho (pipeline.shuffle_buffer,
+usando o gerador rng); com sparse=True o primeiro elemento de cada lote sao os indices activos
+(active_indices) em vez da matriz 0/1. Pode ser envolvido em pipeline.prefetch para que a leitura e a
+codificacao do lote seguinte decorram numa thread durante o treino do lote actual"""
+def stream_csv(f, batch_size, epochs=1, shuffle_buffer=0, sparse=False, rng=None):
+    for _ in range(epochs):
+        linhas = _csv_rows(f)
+        if shuffle_buffer:
+            linhas = pipeline.shuffle_buffer(linhas, shuffle_buffer, rng)
+        for bloco in pipeline.chunked(linhas, batch_size):
+            X, T = patterns_to_arrays([translate(row) for row in bloco])
+            yield (active_indices(X) if sparse else X), T
+
+"""Treina a rede nn (backend numpy) com os lotes (entrada, T) de um fluxo como o de stream_csv, com
+iterate_batch ou, se sparse, iterate_batch_sparse. nn['iter'] conta os padroes vistos"""
+def train_stream(nn, lotes, sparse=False):
+    nn.setdefault('iter', 0)
+    for entrada, T in lotes:
+        if sparse:
+            iterate_batch_sparse(nn, entrada, T)
+        else:
+            iterate_batch(nn, entrada, T)
+        nn['iter'] += len(T)
+    return nn
+
+
+
 """A função translate recebe cada lista de valores simbólicos transforma-a num padrão de treino. 
 Cada padrão é uma lista com o seguinte formato [padrao_de_entrada, classe_do_cogumelo, padrao_de_saida]
 O enunciado do trabalho explica de que forma deve ser obtido o padrão de entrada
@@ -217,62 +492,162 @@ def translate(lista):
 
     # Retornar o padrão de treino completo
     return [padrao_de_entrada, classe_do_cogumelo, padrao_de_saida]
+
+
+"""Converte uma lista de padroes no formato devolvido por translate em duas matrizes:
+X com um padrao de entrada por linha e T com o padrao de saida correspondente"""
+def patterns_to_arrays(patterns):
+    X = np.array([pattern[0] for pattern in patterns], dtype=np.float64)
+    T = np.array([pattern[2] for pattern in patterns], dtype=np.float64)
+    return X, T
     
     
 
 """Cria a rede e chama a funçao iterate para a treinar. A função recebe como argumento os conjuntos de treino e teste,
-os tamanhos das camadas de entrada, escondida e saída e o número de épocas que irão ser usadas para fazer o treino"""
-def train_mushrooms(input_size, hidden_size, output_size, training_set, test_set, epochs, print_step):
+os tamanhos das camadas de entrada, escondida e saída e o número de épocas que irão ser usadas para fazer o treino.
+Com batch_size=1 a rede e treinada padrao a padrao com iterate; com batch_size>1 a rede usa o backend numpy
+e cada actualizacao dos pesos usa a media de batch_size padroes (iterate_batch). Um batch_size igual ao tamanho
+do conjunto de treino corresponde ao treino em lote completo (full-batch).
+As precisoes de treino e teste ao longo do treino sao entregues ao recorder (ver metrics.py), que decide
+quando medir e para onde enviar os valores. Sem recorder e usado um grafico e uma linha no ecra a cada
+print_step iteracoes, excepto com headless=True, caso em que nada e medido.
+Com um profiler (prof) o ciclo de treino e medido como um todo ('training') e, dentro dele, as medicoes
+da precisao ('accuracy') e a entrega dos valores aos sinks do recorder, incluindo o grafico ('metrics');
+o tempo proprio de 'training' e o tempo gasto nas iteracoes de treino.
+Com sparse=True e batch_size=1 as entradas sao convertidas uma vez nos indices activos (active_indices) e
+o treino usa iterate_sparse, que so percorre as colunas de wzx das entradas activas (backend de listas,
+cerca de 6x mais rapido); com batch_size>1 sparse nao tem efeito, porque o produto denso e mais rapido.
+order indica a ordem dos padroes em cada epoca (ver pipeline.epoch_orders): 'fixed' (a do conjunto de
+treino, sempre igual), 'shuffle' ou 'stratify'; os lotes sao gerados epoca a epoca, sem construir a
+lista das epochs repeticoes do conjunto de treino"""
+def train_mushrooms(input_size, hidden_size, output_size, training_set, test_set, epochs, print_step, batch_size=1, headless=False, recorder=None, prof=None, sparse=False, order='fixed'):
    
-    nn = make(input_size, hidden_size, output_size)
-    train_accuracy = []
-    test_accuracy = []
-    steps = []
-
-    print_step = len(training_set) * epochs // 100
-
-    plt.ion()  
-    fig = plt.figure(figsize=(10, 6))
-    ax = fig.add_subplot(111)
-    epoch_count = 0
-
-    # Inicializa as linhas do gráfico 
-    line1, = ax.plot(steps, train_accuracy, label='Training Accuracy', marker='o', linestyle='-', color='blue')
-    line2, = ax.plot(steps, test_accuracy, label='Test Accuracy', marker='x', linestyle='--', color='orange')
-    ax.set_xlabel('Step', fontsize=12)
-    ax.set_ylabel('Accuracy', fontsize=12)
-    ax.set_title('Training and Testing Accuracy Over Time', fontsize=14)
-    ax.legend(fontsize=12, loc='upper right')
-    ax.grid(axis='y', linestyle='--')
-    ax.set_ylim([0, 100]) 
-
-    for pattern in training_set * epochs:
-        iterate(nn, pattern[0], pattern[2])
-
-        if nn['iter'] % print_step == 0:
-            train_accuracy.append(test_mushrooms(nn, training_set, printing=False))
-            test_accuracy.append(test_mushrooms(nn, test_set, printing=False))
-            steps.append(nn['iter'])
-
-            # Atualiza os dados das linhas 
-            line1.set_data(steps, train_accuracy)
-            line2.set_data(steps, test_accuracy)
-            ax.relim()  # Recalcula os limites dos eixos
-            ax.autoscale_view()  # Ajusta a visualização aos novos limites
-            plt.pause(0.001)
-        
-        epoch_count += 1
-        if epoch_count >= epochs:
-            break
-
-    plt.ioff()
-    plt.show()
-
+    nn = make(input_size, hidden_size, output_size, 'list' if batch_size == 1 else 'numpy')
+    nn['iter'] = 0
+
+    print_step = max(1, len(training_set) * epochs // 100)
+    if recorder is None and not headless:
+        recorder = metrics.make_recorder([metrics.plot_sink(), metrics.stdout_sink()], every=print_step)
+    every = metrics.recorder_every(recorder)
+
+    # Matrizes usadas nas medicoes periodicas da precisao, construidas uma unica vez
+    with _phase(prof, 'patterns_to_arrays'):
+        X, T = patterns_to_arrays(training_set)
+        X_test, T_test = patterns_to_arrays(test_set)
+
+    def snapshot():
+        if metrics.due(recorder, nn['iter']):
+            with _phase(prof, 'accuracy'):
+                valores = {'train_accuracy': accuracy_many(nn, X, T), 'test_accuracy': accuracy_many(nn, X_test, T_test)}
+            with _phase(prof, 'metrics'):
+                metrics.record(recorder, nn['iter'], **valores)
+
+    # Ordem dos padroes em cada epoca (ver pipeline.py); com 'fixed' o gerador aleatorio nem e criado
+    rng = None if order == 'fixed' else np.random.default_rng(random.getrandbits(64))
+    ordens = pipeline.epoch_orders(np.argmax(T, axis=1), epochs, order, rng)
+
+    with _phase(prof, 'training'):
+        if batch_size == 1:
+            entradas = active_indices(X).tolist() if sparse else [pattern[0] for pattern in training_set]
+            for ordem in ordens:
+                for k in ordem.tolist():
+                    if sparse:
+                        iterate_sparse(nn, entradas[k], training_set[k][2])
+                    else:
+                        iterate(nn['iter'], nn, entradas[k], training_set[k][2], printing=False)
+                    nn['iter'] += 1
+
+                    if nn['iter'] % every == 0:
+                        snapshot()
+        else:
+            # Copiar um lote das matrizes em memoria e mais barato do que passa-lo entre threads, por isso
+            # aqui nao se usa pipeline.prefetch (que compensa quando o lote vem do CSV, ver stream_csv).
+            # Em lotes a matriz densa X (que ja esta em memoria) e mais rapida, mesmo com sparse=True
+            for lote, T_lote in pipeline.batches(ordens, batch_size, X, T):
+                iterate_batch(nn, lote, T_lote)
+                anterior = nn['iter']
+                nn['iter'] += len(T_lote)
+
+                # Regista a precisao sempre que o lote atravessa um multiplo de every
+                if nn['iter'] // every > anterior // every:
+                    snapshot()
+
+    if prof:
+        prof['count']('patterns', nn['iter'])
+    with _phase(prof, 'metrics'):
+        metrics.close(recorder)
     return nn
          
      
   
 
+#------------------GRAVACAO E LEITURA DE REDES TREINADAS------------
+#Formato do ficheiro: um cabecalho de 64 bytes (net_header.size) seguido de wzx e wyz em float64 little-endian
+#(por linhas, tal como em memoria), para que os pesos possam ser abertos com memory-map sem copias.
+#O cabecalho tem a assinatura, a versao do formato, nx, nz, ny, o alpha usado no treino, a versao da
+#codificacao das entradas (encoding_version) e o CRC32 dos pesos. O tamanho do cabecalho e multiplo de 8
+#para que os pesos mapeados fiquem alinhados (um float64 desalinhado torna todas as contas mais lentas).
+#A versao 1 tinha um cabecalho de 74 bytes e ja nao e lida.
+net_magic = b'NNMUSH'
+net_format = 2
+net_header = struct.Struct('<6sHIIId16sI16x')
+assert net_header.size % 8 == 0
+
+"""Identificador da codificacao das entradas (hash do dicionario): uma rede so pode ser usada com padroes
+codificados pelo mesmo dicionario com que foi treinada"""
+def encoding_version():
+    return hashlib.sha1(repr(dicionario).encode()).hexdigest()[:16]
+
+"""Grava a rede net (de qualquer backend) no ficheiro path. A escrita e feita num ficheiro temporario
+que depois substitui path, pelo que um processo que esteja a ler o modelo nunca ve um ficheiro incompleto"""
+def save_net(net, path):
+    wzx = np.ascontiguousarray(net['wzx'], dtype='<f8')
+    wyz = np.ascontiguousarray(net['wyz'], dtype='<f8')
+    pesos = wzx.tobytes() + wyz.tobytes()
+    header = net_header.pack(net_magic, net_format, net['nx'], net['nz'], net['ny'], net.get('alpha', alpha),
+                             encoding_version().encode(), zlib.crc32(pesos))
+
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as out:
+        out.write(header)
+        out.write(pesos)
+    os.replace(tmp, path)
+
+"""Le uma rede gravada com save_net e devolve-a com backend='numpy'.
+Com mmap=True os pesos sao arrays so de leitura mapeados directamente do ficheiro (varios processos
+partilham as mesmas paginas e o arranque nao depende do tamanho da rede); servem para inferencia
+(forward, predict_many, test_mushrooms) mas nao para continuar o treino. Com mmap=False os pesos sao
+copiados para memoria e a rede pode ser treinada normalmente.
+verify=False salta a verificacao do CRC32 (que obriga a ler todos os pesos).
+Lanca ValueError se o ficheiro nao for uma rede, estiver truncado ou corrompido, ou se tiver sido
+treinado com outra codificacao das entradas"""
+def load_net(path, mmap=True, verify=True):
+    with open(path, 'rb') as f:
+        raw = f.read(net_header.size)
+    if len(raw) < net_header.size or raw[:len(net_magic)] != net_magic:
+        raise ValueError("%s: nao e um ficheiro de rede" % path)
+    _, versao, nx, nz, ny, net_alpha, codificacao, crc = net_header.unpack(raw)
+    if versao != net_format:
+        raise ValueError("%s: versao do formato %d nao suportada (esperada %d)" % (path, versao, net_format))
+    if codificacao.decode() != encoding_version():
+        raise ValueError("%s: rede treinada com outra codificacao das entradas (%s, actual %s)"
+                         % (path, codificacao.decode(), encoding_version()))
+
+    n = nz * (nx + 1) + ny * (nz + 1)
+    if os.path.getsize(path) != net_header.size + 8 * n:
+        raise ValueError("%s: ficheiro truncado ou com tamanho inesperado" % path)
+    if mmap:
+        pesos = np.memmap(path, dtype='<f8', mode='r', offset=net_header.size, shape=(n,))
+    else:
+        pesos = np.fromfile(path, dtype='<f8', offset=net_header.size, count=n)
+    if verify and zlib.crc32(pesos) != crc:
+        raise ValueError("%s: checksum dos pesos nao confere" % path)
+
+    return {'nx': nx, 'nz': nz, 'ny': ny, 'x': [], 'z': [], 'y': [], 'dz': [], 'dy': [], 'backend': 'numpy',
+            'wzx': pesos[:nz * (nx + 1)].reshape(nz, nx + 1), 'wyz': pesos[nz * (nx + 1):].reshape(ny, nz + 1),
+            'alpha': net_alpha}
+
+
 """Recebe o padrao de saida da rede e devolve a classe com que a rede classificou o cogumelo.
 Devolve a classe que corresponde ao indice da saida com maior valor."""
 def retranslate(out):
@@ -281,26 +656,49 @@ def retranslate(out):
     else:
         return 'poisonous'  # Caso contrário, retorna 'poisonous' (venenoso)
 
+#nomes das classes pela ordem das saidas da rede (o mesmo que devolve retranslate)
+classes = ['edible', 'poisonous']
+
+
+"""Recebe uma rede e uma matriz X com um padrao de entrada por linha e devolve um array com o indice
+da classe escolhida pela rede para cada padrao (0 para edible, 1 para poisonous).
+Ao contrario de forward, nao altera nn['x'], nn['z'] nem nn['y'], e funciona com os dois backends.
+Em caso de empate e escolhida a ultima saida, tal como em retranslate"""
+def predict_many(net, X):
+    X = np.asarray(X, dtype=np.float64)
+    wzx = np.asarray(net['wzx'], dtype=np.float64)
+    wyz = np.asarray(net['wyz'], dtype=np.float64)
+
+    #os pesos do bias multiplicam sempre -1, por isso basta subtrair a ultima coluna
+    z = sig_np(X @ wzx[:, :-1].T - wzx[:, -1])
+    y = sig_np(z @ wyz[:, :-1].T - wyz[:, -1])
+
+    #argmax sobre as colunas invertidas para que os empates fiquem com o maior indice
+    return y.shape[1] - 1 - np.argmax(y[:, ::-1], axis=1)
+
+
+"""Percentagem de padroes de X que a rede classifica com a classe indicada em T (saidas pretendidas)"""
+def accuracy_many(net, X, T):
+    if len(X) == 0:
+        return 0.0
+    return float(np.mean(predict_many(net, X) == np.argmax(T, axis=1))) * 100
+
 
 """Funcao que avalia a precisao da rede treinada, utilizando o conjunto de teste ou treino.
-Para cada padrao do conjunto chama a funcao forward e determina a classe do cogumelo
+Para cada padrao do conjunto determina (com predict_many, de uma so vez) a classe do cogumelo
 que corresponde ao maior valor da lista de saida. A classe determinada pela rede deve ser comparada com a classe real,
 sendo contabilizado o número de respostas corretas. A função calcula a percentagem de respostas corretas"""    
 def test_mushrooms(net, test_set, printing = True):
-     correct_predictions = 0  # Contador de previsões corretas
-     total_predictions = len(test_set)  # Total de previsões
-
-     for i, pattern in enumerate(test_set):  
-        inputs = pattern[0]  # Entrada
-        expected_class = pattern[1]  # Classe esperada
-        forward(net, inputs)  
-        predicted_class = retranslate(net['y'])  
-        if printing:  # Se a impressão estiver habilitada
-            print(f"The network thinks mushrooms number {i + 1} is {predicted_class}, it should be {expected_class}")
-        if predicted_class == expected_class:  # Se a classe prevista for igual à esperada
-            correct_predictions += 1  # Incrementa o contador de previsões corretas
-
-     accuracy = (correct_predictions / total_predictions) * 100  # Calcula a precisão
+     X, T = patterns_to_arrays(test_set)
+     predicted = predict_many(net, X)
+     expected = np.argmax(T, axis=1)
+
+     if printing:  # Se a impressão estiver habilitada
+        for i, pattern in enumerate(test_set):
+            print(f"The network thinks mushrooms number {i + 1} is {classes[predicted[i]]}, it should be {classes[expected[i]]}")
+
+     # Calcula a precisão a partir das previsoes ja feitas (sem voltar a correr predict_many)
+     accuracy = float(np.mean(predicted == expected)) * 100 if len(test_set) else 0.0
      
      if printing:  
         print(f"Success rate: {accuracy:.2f}")
@@ -0,0 +1,215 @@
+"""Treino da rede dos cogumelos em paralelo de dados (data-parallel) com varios processos.
+
+Os padroes de treino (X e T) e os pesos ficam em memoria partilhada (multiprocessing.shared_memory),
+pelo que nada e copiado entre processos durante o treino. Todos os processos calculam a mesma ordem
+dos padroes em cada epoca (pipeline.epoch_orders com a mesma semente) e dividem-na entre si.
+
+Dois modos:
+    deterministic=True   (sincrono) cada lote global de batch_size padroes e repartido pelos
+                         processos; cada um calcula, com forward_batch e error_batch, a soma das
+                         correccoes da sua parte e escreve-a no seu lugar de um buffer partilhado.
+                         Depois de uma barreira todos somam os buffers pela mesma ordem e aplicam a
+                         mesma actualizacao (a media do lote, como update_batch) a sua replica dos
+                         pesos. O resultado so depende da semente e do numero de processos.
+    deterministic=False  (Hogwild) cada processo treina a sua fatia de cada epoca em lotes de
+                         batch_size e actualiza directamente os pesos partilhados, sem trincos nem
+                         barreiras; as actualizacoes de processos diferentes podem sobrepor-se, pelo
+                         que o resultado varia de execucao para execucao.
+
+No modo sincrono ha uma barreira por lote, por isso o ganho com mais processos so aparece com lotes
+grandes (centenas de padroes); o modo Hogwild escala mesmo com lotes pequenos.
+
+Exemplo:
+    python parallel.py --workers 8 --epochs 10 --train 6000 --batch-size 512 --compare
+"""
+
+import argparse
+import multiprocessing as mp
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import nn_alunos as nn
+import pipeline
+
+
+def _shared(shape, dtype=np.float64, data=None):
+    """Cria um bloco de memoria partilhada e devolve-o com um array sobre ele (copia de data, se indicado)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    if data is not None:
+        arr[...] = data
+    return shm, arr
+
+
+def _attach(nome, shape, dtype=np.float64):
+    shm = shared_memory.SharedMemory(name=nome)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _views(W, nx, nz, ny):
+    """wzx e wyz como vistas (sem copia) sobre o vector de pesos W"""
+    return W[:nz * (nx + 1)].reshape(nz, nx + 1), W[nz * (nx + 1):].reshape(ny, nz + 1)
+
+
+def _worker(rank, spec, barrier):
+    nx, nz, ny, workers = spec['nx'], spec['nz'], spec['ny'], spec['workers']
+    nw = nz * (nx + 1) + ny * (nz + 1)
+    blocos = []
+    try:
+        shm, X = _attach(spec['X'], (spec['n'], nx))
+        blocos.append(shm)
+        shm, T = _attach(spec['T'], (spec['n'], ny))
+        blocos.append(shm)
+        shm, W = _attach(spec['W'], (nw,))
+        blocos.append(shm)
+
+        rng = np.random.default_rng(spec['seed']) if spec['order'] != 'fixed' else None
+        ordens = pipeline.epoch_orders(np.argmax(T, axis=1), spec['epochs'], spec['order'], rng)
+        net = {'nx': nx, 'nz': nz, 'ny': ny, 'backend': 'numpy'}
+
+        if spec['deterministic']:
+            shm, G = _attach(spec['G'], (2, workers, nw))
+            blocos.append(shm)
+            _sync(rank, spec, barrier, net, X, T, W, G, ordens)
+        else:
+            _hogwild(rank, spec, net, X, T, W, ordens)
+    except BaseException:
+        #sem isto os outros processos ficariam para sempre a espera na barreira
+        barrier.abort()
+        raise
+    finally:
+        for shm in blocos:
+            shm.close()
+
+
+def _sync(rank, spec, barrier, net, X, T, W, G, ordens):
+    nx, nz, ny, workers = spec['nx'], spec['nz'], spec['ny'], spec['workers']
+    replica = W.copy()
+    net['wzx'], net['wyz'] = _views(replica, nx, nz, ny)
+    passo = 0
+    for ordem in ordens:
+        for inicio in range(0, len(ordem), spec['batch_size']):
+            lote = ordem[inicio:inicio + spec['batch_size']]
+            parte = lote[rank::workers]
+
+            # Os buffers alternam entre passos, pelo que basta uma barreira por lote: um processo so volta
+            # a escrever em G[p] depois de todos terem passado a barreira do passo seguinte
+            g = G[passo % 2, rank]
+            gzx, gyz = _views(g, nx, nz, ny)
+            if len(parte):
+                nn.forward_batch(net, X[parte])
+                nn.error_batch(net, T[parte])
+                np.matmul(net['dz'].T, net['x'], out=gzx)
+                np.matmul(net['dy'].T, net['z'], out=gyz)
+            else:
+                g[:] = 0.0
+            barrier.wait()
+
+            # Soma pela ordem dos processos (igual em todos), para que as replicas se mantenham identicas
+            total = G[passo % 2, 0].copy()
+            for w in range(1, workers):
+                total += G[passo % 2, w]
+            replica += (nn.alpha / len(lote)) * total
+            passo += 1
+
+    if rank == 0:
+        W[:] = replica
+
+
+def _hogwild(rank, spec, net, X, T, W, ordens):
+    #os pesos da rede sao vistas sobre a memoria partilhada: update_batch escreve directamente nela
+    net['wzx'], net['wyz'] = _views(W, spec['nx'], spec['nz'], spec['ny'])
+    for ordem in ordens:
+        fatia = np.array_split(ordem, spec['workers'])[rank]
+        for inicio in range(0, len(fatia), spec['batch_size']):
+            sel = fatia[inicio:inicio + spec['batch_size']]
+            nn.iterate_batch(net, X[sel], T[sel])
+
+
+def train_parallel(net, X, T, epochs, batch_size=256, workers=None, deterministic=True, order='shuffle', seed=0):
+    """Treina a rede net (criada com make, de qualquer backend) com os padroes X e saidas T durante epochs
+    epocas, usando workers processos (por omissao, um por CPU). Devolve uma rede nova com backend numpy,
+    com os pesos finais e nn['iter'] igual ao numero de padroes vistos. order e seed escolhem a ordem dos
+    padroes em cada epoca (ver pipeline.epoch_orders); deterministic escolhe o modo (ver acima)"""
+    workers = workers or mp.cpu_count()
+    nx, nz, ny = net['nx'], net['nz'], net['ny']
+    X = np.asarray(X, dtype=np.float64)
+    T = np.asarray(T, dtype=np.float64)
+    pesos = np.concatenate((np.asarray(net['wzx'], dtype=np.float64).ravel(),
+                            np.asarray(net['wyz'], dtype=np.float64).ravel()))
+    if order not in pipeline.orders:
+        raise ValueError("ordem desconhecida: %r (esperada uma de %s)" % (order, ', '.join(pipeline.orders)))
+
+    blocos = []
+    processos = []
+    try:
+        shm_x, _ = _shared(X.shape, data=X)
+        blocos.append(shm_x)
+        shm_t, _ = _shared(T.shape, data=T)
+        blocos.append(shm_t)
+        shm_w, W = _shared(pesos.shape, data=pesos)
+        blocos.append(shm_w)
+        spec = {'nx': nx, 'nz': nz, 'ny': ny, 'n': len(X), 'workers': workers, 'epochs': epochs,
+                'batch_size': batch_size, 'order': order, 'seed': seed, 'deterministic': deterministic,
+                'X': shm_x.name, 'T': shm_t.name, 'W': shm_w.name}
+        if deterministic:
+            shm_g, _ = _shared((2, workers, len(pesos)))
+            blocos.append(shm_g)
+            spec['G'] = shm_g.name
+
+        barrier = mp.Barrier(workers)
+        for rank in range(workers):
+            p = mp.Process(target=_worker, args=(rank, spec, barrier), daemon=True)
+            p.start()
+            processos.append(p)
+        for p in processos:
+            p.join()
+        if any(p.exitcode != 0 for p in processos):
+            raise RuntimeError("um dos processos de treino terminou com erro")
+
+        wzx, wyz = _views(W.copy(), nx, nz, ny)
+    finally:
+        for p in processos:
+            if p.is_alive():
+                p.terminate()
+        for shm in blocos:
+            shm.close()
+            shm.unlink()
+
+    return {'nx': nx, 'nz': nz, 'ny': ny, 'x': [], 'z': [], 'y': [], 'dz': [], 'dy': [], 'backend': 'numpy',
+            'wzx': wzx, 'wyz': wyz, 'iter': epochs * len(X)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='mushrooms.csv')
+    parser.add_argument('--hidden', type=int, default=11)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--train', type=int, default=6000)
+    parser.add_argument('--test', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--hogwild', action='store_true', help='modo nao determinista (sem barreiras)')
+    parser.add_argument('--order', choices=pipeline.orders, default='shuffle')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', action='store_true', help='corre tambem com um so processo e mostra o ganho')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    train_set, test_set = nn.build_sets(args.csv, args.train, args.test)
+    X, T = nn.patterns_to_arrays(train_set)
+    X_test, T_test = nn.patterns_to_arrays(test_set)
+    inicial = nn.make(nn.encoded_input_size(), args.hidden, 2, 'numpy')
+
+    tempos = []
+    for workers in ([1] if args.compare else []) + [args.workers or mp.cpu_count()]:
+        inicio = time.perf_counter()
+        net = train_parallel(inicial, X, T, args.epochs, args.batch_size, workers, not args.hogwild, args.order, args.seed)
+        tempos.append(time.perf_counter() - inicio)
+        print("{} processo(s): {:.2f}s, precisao de teste {:.2f}%".format(
+            workers, tempos[-1], nn.accuracy_many(net, X_test, T_test)))
+    if len(tempos) == 2:
+        print("Ganho: {:.2f}x".format(tempos[0] / tempos[1]))
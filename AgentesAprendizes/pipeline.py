@@ -0,0 +1,178 @@
+"""Pipeline de dados para o treino: ordem dos padroes em cada epoca, lotes e leitura antecipada.
+
+    epoch_orders    para cada epoca, a ordem pela qual os padroes sao apresentados:
+                    'fixed' (sempre a ordem original), 'shuffle' (uma permutacao nova em cada
+                    epoca) ou 'stratify' (permutacao com as classes intercaladas na proporcao
+                    do conjunto, para que cada lote tenha aproximadamente essa proporcao)
+    batches         percorre essas ordens em lotes e devolve as linhas correspondentes das
+                    matrizes indicadas; so o lote actual e copiado, nunca o conjunto x epocas
+    shuffle_buffer  baralha um fluxo que nao cabe em memoria com um buffer de tamanho fixo
+    chunked         agrupa um fluxo de elementos em listas de tamanho fixo
+    prefetch        corre um gerador numa thread em segundo plano, que vai preparando os
+                    proximos elementos (ate depth) enquanto o actual esta a ser usado
+
+Tudo sao geradores, pelo que a memoria usada nao depende do numero de epocas. A leitura em
+fluxo do CSV dos cogumelos (stream_csv) e o treino a partir de um fluxo de lotes
+(train_stream) estao em nn_alunos.py.
+
+Exemplo (treino a partir do CSV sem o carregar todo):
+    python pipeline.py mushrooms.csv --epochs 5 --batch-size 32 --shuffle-buffer 2000 --sparse
+"""
+
+import argparse
+import queue
+import threading
+
+import numpy as np
+
+orders = ('fixed', 'shuffle', 'stratify')
+
+
+def epoch_orders(labels, epochs, order='fixed', rng=None):
+    """Gerador com um array de indices por epoca. labels (a classe de cada padrao) so e usado
+    com order='stratify'; rng e um np.random.Generator, obrigatorio excepto com 'fixed'"""
+    if order not in orders:
+        raise ValueError("ordem desconhecida: %r (esperada uma de %s)" % (order, ', '.join(orders)))
+    if order != 'fixed' and rng is None:
+        raise ValueError("a ordem %r precisa de um gerador aleatorio (rng)" % order)
+    return _epoch_orders(np.asarray(labels), epochs, order, rng)
+
+
+def _epoch_orders(labels, epochs, order, rng):
+    for _ in range(epochs):
+        if order == 'fixed':
+            yield np.arange(len(labels))
+        elif order == 'shuffle':
+            yield rng.permutation(len(labels))
+        else:
+            yield stratified_order(labels, rng)
+
+
+def stratified_order(labels, rng):
+    """Permutacao em que o k-esimo padrao (baralhado) de uma classe com n padroes fica na posicao
+    relativa (k + u) / n, com u sorteado por classe; ordenando por essa posicao as classes ficam
+    intercaladas na sua proporcao ao longo de toda a epoca"""
+    chave = np.empty(len(labels))
+    for c in np.unique(labels):
+        idx = np.flatnonzero(labels == c)
+        chave[rng.permutation(idx)] = (np.arange(len(idx)) + rng.random()) / len(idx)
+    return np.argsort(chave, kind='stable')
+
+
+def batches(epoch_orders, batch_size, *arrays):
+    """Para cada ordem de epoca, devolve tuplos com as linhas de cada array em lotes de batch_size
+    (o ultimo lote de cada epoca pode ser mais pequeno)"""
+    for ordem in epoch_orders:
+        for inicio in range(0, len(ordem), batch_size):
+            sel = ordem[inicio:inicio + batch_size]
+            yield tuple(a[sel] for a in arrays)
+
+
+def chunked(stream, size):
+    chunk = []
+    for item in stream:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def shuffle_buffer(stream, size, rng):
+    """Baralha um fluxo com um buffer de size elementos: cada novo elemento substitui, no buffer,
+    um elemento sorteado, que e o devolvido. Com size >= tamanho do fluxo e uma permutacao uniforme;
+    com buffers menores cada elemento so pode sair ate size posicoes antes da sua posicao original"""
+    buf = []
+    for item in stream:
+        if len(buf) < size:
+            buf.append(item)
+            continue
+        j = rng.integers(size)
+        yield buf[j]
+        buf[j] = item
+    for j in rng.permutation(len(buf)):
+        yield buf[j]
+
+
+_end = object()
+
+
+def prefetch(gen, depth=2):
+    """Corre o gerador gen numa thread e devolve os seus elementos pela mesma ordem, mantendo
+    ate depth elementos ja preparados. Uma excepcao em gen e relancada no consumidor; se o
+    consumidor parar antes do fim (break, excepcao ou close) a thread e terminada"""
+    fila = queue.Queue(maxsize=max(1, depth))
+    parar = threading.Event()
+
+    def put(item):
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in gen:
+                if not put((True, item)):
+                    return
+            put((True, _end))
+        except BaseException as e:
+            put((False, e))
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while True:
+            ok, item = fila.get()
+            if not ok:
+                raise item
+            if item is _end:
+                return
+            yield item
+    finally:
+        parar.set()
+        thread.join()
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    import nn_alunos as nn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('csv_file')
+    parser.add_argument('--hidden', type=int, default=11)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--shuffle-buffer', type=int, default=2000, help='0 le o CSV sempre pela mesma ordem')
+    parser.add_argument('--prefetch', type=int, default=2, help='lotes preparados em avanco (0 desliga a thread)')
+    parser.add_argument('--sparse', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='FICHEIRO', help='grava a rede treinada (ver save_net)')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    net = nn.make(nn.encoded_input_size(), args.hidden, 2, 'numpy')
+    lotes = nn.stream_csv(args.csv_file, args.batch_size, args.epochs, args.shuffle_buffer, args.sparse, rng)
+    if args.prefetch:
+        lotes = prefetch(lotes, args.prefetch)
+
+    inicio = time.perf_counter()
+    nn.train_stream(net, lotes, args.sparse)
+    tempo = time.perf_counter() - inicio
+    print("{} padroes em {:.2f}s ({:.0f} padroes/s)".format(net['iter'], tempo, net['iter'] / tempo))
+
+    # Precisao sobre o CSV completo, tambem lido em fluxo
+    certos = total = 0
+    for X, T in nn.stream_csv(args.csv_file, 4096):
+        certos += int((nn.predict_many(net, X) == np.argmax(T, axis=1)).sum())
+        total += len(X)
+    print("Precisao no ficheiro: {:.2f}%".format(100 * certos / total))
+    if args.save:
+        nn.save_net(net, args.save)
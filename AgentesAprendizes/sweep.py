@@ -0,0 +1,112 @@
+"""Varrimento de hiperparametros para a rede que classifica cogumelos.
+
+Corre as mesmas configuracoes do bloco __main__ de nn_alunos.py
+(hidden_sizes x epochs_list x training_set_sizes), sem graficos nem pausas,
+distribuidas por um conjunto de processos. Cada corrida tem a sua propria
+semente, pelo que o resultado nao depende do numero de processos nem da
+ordem em que as corridas terminam.
+
+O dataset codificado e carregado uma unica vez no processo principal
+(load_dataset cria a cache binaria se for preciso); os processos filhos
+herdam-no ou abrem a mesma cache com memory-map, em vez de lerem o CSV.
+
+Exemplo:
+    python sweep.py --workers 32 --out resultados.csv
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import nn_alunos
+
+
+def _init_worker(csv_file):
+    # Com 'fork' o dataset ja vem do processo pai; com 'spawn' e aberta a cache em memory-map
+    nn_alunos.load_dataset(csv_file)
+
+
+def run_config(config):
+    """Corre uma configuracao (um dicionario com os argumentos de run_mushrooms e a semente)
+    e devolve o mesmo dicionario acrescentado com a precisao de teste e o tempo de execucao."""
+    random.seed(config['seed'])
+    inicio = time.perf_counter()
+    accuracy = nn_alunos.run_mushrooms(config['csv_file'], config['input_size'], config['hidden_size'],
+                                       config['output_size'], config['epochs'], config['training_set_size'],
+                                       config['test_set_size'], print_step=10,
+                                       batch_size=config['batch_size'], headless=True)
+    result = dict(config)
+    result['test_accuracy'] = accuracy
+    result['wall_time'] = time.perf_counter() - inicio
+    return result
+
+
+def make_configs(csv_file, hidden_sizes, epochs_list, training_set_sizes, test_set_size=1000,
+                 input_size=126, output_size=2, batch_size=1, repeats=1, seed=0):
+    """Lista de configuracoes da grelha; a corrida numero i usa a semente seed + i"""
+    configs = []
+    grelha = itertools.product(hidden_sizes, epochs_list, training_set_sizes, range(repeats))
+    for i, (hidden_size, epochs, training_set_size, repeat) in enumerate(grelha):
+        configs.append({'run': i, 'seed': seed + i, 'repeat': repeat, 'csv_file': csv_file,
+                        'input_size': input_size, 'hidden_size': hidden_size, 'output_size': output_size,
+                        'epochs': epochs, 'training_set_size': training_set_size,
+                        'test_set_size': test_set_size, 'batch_size': batch_size})
+    return configs
+
+
+def run_sweep(configs, workers=None, out=None):
+    """Corre as configuracoes em paralelo e devolve os resultados pela ordem das configuracoes.
+    Se out for indicado, escreve tambem a tabela de resultados nesse ficheiro CSV."""
+    if not configs:
+        return []
+
+    csv_file = configs[0]['csv_file']
+    nn_alunos.load_dataset(csv_file)
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(csv_file,)) as pool:
+        results = list(pool.map(run_config, configs))
+
+    if out:
+        write_results(results, out)
+    return results
+
+
+fields = ['run', 'seed', 'repeat', 'hidden_size', 'epochs', 'training_set_size', 'test_set_size',
+          'batch_size', 'test_accuracy', 'wall_time']
+
+
+def write_results(results, out):
+    with open(out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--csv', default='mushrooms.csv')
+    parser.add_argument('--hidden', type=int, nargs='+', default=[4, 7, 11])
+    parser.add_argument('--epochs', type=int, nargs='+', default=[2, 5, 10])
+    parser.add_argument('--train', type=int, nargs='+', default=[200, 1000, 6000])
+    parser.add_argument('--test', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    configs = make_configs(args.csv, args.hidden, args.epochs, args.train, args.test,
+                           batch_size=args.batch_size, repeats=args.repeats, seed=args.seed)
+    results = run_sweep(configs, args.workers, args.out)
+
+    print("| {:>6} | {:>6} | {:>6} | {:>8} | {:>9} |".format('hidden', 'epochs', 'train', 'accuracy', 'time (s)'))
+    for r in results:
+        print("| {:>6} | {:>6} | {:>6} | {:>8.2f} | {:>9.2f} |".format(
+            r['hidden_size'], r['epochs'], r['training_set_size'], r['test_accuracy'], r['wall_time']))
+    print("Resultados guardados em", args.out)
@@ -1,4 +1,12 @@
+import contextlib
+import glob
+import hashlib
+import os
 import random
+import time
+from collections import OrderedDict
+
+import numpy as np
 import matplotlib.pyplot as plt
 
 pop_size = 20            # Tamanho da populacao, deve ser par
@@ -6,14 +14,42 @@ n_gen = 20                # Numero de geracoes
 
 pc = 0.75                 # Probabilidade de recombinacao em percentagem
 pm = 0.0001                 # Probabilidade de mutacao em percentagem
+tourn_size = 3            # Tamanho do torneio na seleccao
+cache_size = 0            # Numero maximo de genomas na cache de fitness (0 desliga a cache)
+use_repair = False        # Reparar os individuos acima do limite de peso (ver repair)
+seeding = 'random'        # Populacao inicial: 'random' (um terco dos itens) ou 'greedy' (greedy aleatorizado)
+greedy_noise = 0.5        # Ruido aplicado as razoes valor/peso no seeding 'greedy'
+
+# Gerador usado nas operacoes vectorizadas; seed() inicializa este e o do modulo random
+rng = np.random.default_rng()
+
+
+def seed(s):
+    """Inicializa os geradores aleatorios para que uma execucao possa ser repetida"""
+    global rng
+    random.seed(s)
+    rng = np.random.default_rng(s)
+
+
+def _phase(prof, nome):
+    """Fase medida pelo profiler prof (ver profiling.py na raiz do repositorio); sem profiler nao mede nada"""
+    return prof['phase'](nome) if prof else contextlib.nullcontext()
 
 
-def run_ga(prob_file):
+def run_ga(prob_file, patience=None, min_diversity=None, target=None, time_budget=None, printing=True, plot=True, prof=None):
     """Função que deve ser executada para resolver o problema.
     Executa o ciclo principal do GA durante n_gen gerações chamando as outras funções implementadas.
+    O ciclo pode terminar mais cedo com os criterios de paragem de evolve.
     
     Args:
         prob_file (str): Caminho do arquivo contendo informações sobre o problema.
+        patience, min_diversity, target, time_budget: criterios de paragem (ver evolve).
+        printing (bool): Imprime as tabelas do problema e da populacao e uma linha por geracao.
+        plot (bool): Mostra o grafico do melhor fitness e do fitness medio.
+        prof (dict): Profiler opcional (profiling.make_profiler) que mede o tempo de cada fase.
+
+    Returns:
+        dict: O resultado de evolve (melhor individuo, historico, geracoes e motivo de paragem).
     """
     
     # prob é um dicionário que guarda os dados relativos ao problema a resolver
@@ -24,129 +60,321 @@ def run_ga(prob_file):
     prob = {'n': 0, 'l': 0, 'pesos': [], 'valores': []}
     
    
-    make_prob(prob_file, prob)
-    
-    # Imprime os dados formatados em colunas
-    print("-" * (20 + 10 + 15))
-    print("| {:<15} | {:<10} | {:<10} |".format("Item", "Peso(Kg)", "Lucro(€)"))
-    print("-" * (20 + 10 + 15))
-    for i in range(1, int(prob['n']) + 1):  
-        item_name = 'item ' + str(i)  
-        peso = prob['pesos'][i - 1]
-        valor = prob['valores'][i - 1]
-        print("| {:<15} | {:<10.8f} | {:<10.8f} |".format(item_name, peso, valor))
-    print("-" * (20 + 10 + 15))
+    with _phase(prof, 'make_prob'):
+        make_prob(prob_file, prob, printing=printing)
+    
+    if printing:
+        # Imprime os dados formatados em colunas
+        print("-" * (20 + 10 + 15))
+        print("| {:<15} | {:<10} | {:<10} |".format("Item", "Peso(Kg)", "Lucro(€)"))
+        print("-" * (20 + 10 + 15))
+        for i in range(1, int(prob['n']) + 1):  
+            item_name = 'item ' + str(i)  
+            peso = prob['pesos'][i - 1]
+            valor = prob['valores'][i - 1]
+            print("| {:<15} | {:<10.8f} | {:<10.8f} |".format(item_name, peso, valor))
+        print("-" * (20 + 10 + 15))
     
     # pop é um dicionário que armazena a informação relacionada com a população e os indivíduos que a constituem
-    # 'main' é uma lista que armazena a população principal
-    # 'fitness' guarda o desempenho de cada indivíduo na população principal
-    # 'temp' guarda a população temporária para reprodução
+    # 'main' é uma matriz pop_size x n de 0/1 (uint8) que armazena a população principal, um indivíduo por linha
+    # 'fitness' é um array com o desempenho de cada indivíduo na população principal
+    # 'tot' é uma matriz pop_size x 2 com o peso e o valor totais de cada indivíduo
+    # 'temp' guarda a população temporária para reprodução (mesmo formato de 'main'); 'main' e 'temp'
+    #        sao dois buffers alocados uma vez em make_pop que trocam de papel em cada geração
+    # 'temp_tot' guarda os totais da população temporária
+    # 'parents' guarda os índices em 'main' dos indivíduos escolhidos por select
     # 'besti' é o índice do melhor indivíduo
     # 'average' é a média dos desempenhos da população atual
-    pop = {'main': [], 'fitness': [], 'temp': [], 'besti': 0, 'average': 0}
+    # 'cache' é a cache de fitness (make_cache) ou None
+    pop = {'main': [], 'fitness': [], 'tot': None, 'temp': [], 'temp_tot': None, 'parents': [], 'besti': 0, 'average': 0,
+           'cache': make_cache(cache_size) if cache_size else None}
     
    
-    make_pop(pop, pop_size, prob)
+    with _phase(prof, 'make_pop'):
+        make_pop(pop, pop_size, prob)
     
     
-    # Imprime os dados formatados em colunas
-    print("Criação da população inicial")
-    print("-" * (20 + 40  + 25))
-    print("| {:<15} | {:<40} | {:<21}|".format("Individuo", "Genes", "Fitness"))
-    print("-" * (20 + 40 + 25))
+    if printing:
+        # Imprime os dados formatados em colunas
+        print("Criação da população inicial")
+        print("-" * (20 + 40  + 25))
+        print("| {:<15} | {:<40} | {:<21}|".format("Individuo", "Genes", "Fitness"))
+        print("-" * (20 + 40 + 25))
    
-    for i, ind in enumerate(pop['main']):
-        genes_str = ' '.join(map(str, ind))
-        print("| {:<15} | {:<40} | {:<20} |".format(i, genes_str, pop['fitness'][i]))
-    print("-" * (20 + 40 + 25))  
-    
-    melhores_fitness = []  # Para armazenar o melhor fitness de cada geração
-    media_fitness = []   # Para armazenar a média do fitness de cada geração               
-    
-   # Loop principal do algoritmo genético
-    for geracao in range(n_gen):
-       select(pop)  
-       reproduce(pop, prob)  
-       replace(pop)  
-       evaluate(pop, prob)
+        for i, ind in enumerate(pop['main']):
+            genes_str = ' '.join(map(str, ind))
+            print("| {:<15} | {:<40} | {:<20} |".format(i, genes_str, pop['fitness'][i]))
+        print("-" * (20 + 40 + 25))
+    
+    # Loop principal do algoritmo genético
+    with _phase(prof, 'evolve'):
+        result = evolve(pop, prob, n_gen, patience, min_diversity, target, time_budget, printing, prof)
        
-       print(f"gen.: {geracao + 1} best: {pop['besti']} best: {pop['fitness'][pop['besti']]:.3f} average: {pop['average']:.3f}")
+    if plot:
+        with _phase(prof, 'plot'):
+            geracoes = list(range(1, result['generations'] + 1))  
+            plt.figure(figsize=(10, 5))  
+            plt.plot(geracoes, result['best_history'], label='Melhor Fitness', color='blue')
+            plt.plot(geracoes, result['average_history'], label='Fitness Médio', color='orange')
+            plt.title('Desempenho do AG ao Longo das Gerações')
+            plt.xlabel('Geração')
+            plt.ylabel('Fitness')
+            plt.legend()
+            plt.grid(True) 
+            plt.show()
 
-       melhores_fitness.append(pop['fitness'][pop['besti']])
-       media_fitness.append(pop['average'])
-       
-       
-    geracoes = list(range(1, n_gen + 1))  
-    plt.figure(figsize=(10, 5))  
-    plt.plot(geracoes, melhores_fitness, label='Melhor Fitness', color='blue')
-    plt.plot(geracoes, media_fitness, label='Fitness Médio', color='orange')
-    plt.title('Desempenho do AG ao Longo das Gerações')
-    plt.xlabel('Geração')
-    plt.ylabel('Fitness')
-    plt.legend()
-    plt.grid(True) 
-    plt.show()
+    if printing and pop['cache'] is not None:
+        print("Cache de fitness: {hits} hits, {misses} misses, {size} genomas ({hit_rate:.1%})".format(**cache_stats(pop['cache'])))
+
+    return result
+
+
+def evolve(pop, prob, n_gen, patience=None, min_diversity=None, target=None, time_budget=None, printing=False, prof=None):
+    """Faz evoluir a populacao durante no maximo n_gen geracoes. O ciclo termina mais cedo se
+    algum dos criterios indicados (None desliga o criterio) for atingido:
+        patience       o melhor fitness nao melhorou nas ultimas patience geracoes
+        min_diversity  a distancia de Hamming media dos individuos ao melhor e inferior a min_diversity genes
+        target         o melhor fitness atingiu target
+        time_budget    passaram time_budget segundos desde o inicio
+    Devolve um dicionario com o melhor individuo encontrado ('best', 'best_fitness'), o historico
+    por geracao do melhor e do fitness medio ('best_history', 'average_history' e, se min_diversity
+    for usado, 'diversity_history'), o numero de geracoes feitas ('generations') e o motivo de
+    paragem ('stop_reason': 'n_gen', 'patience', 'diversity', 'target' ou 'time_budget')"""
+    inicio = time.perf_counter()
+    result = {'best': pop['main'][pop['besti']].copy(), 'best_fitness': float(pop['fitness'][pop['besti']]),
+              'best_history': [], 'average_history': [], 'diversity_history': [],
+              'generations': 0, 'stop_reason': 'n_gen'}
+    sem_melhoria = 0
+
+    for geracao in range(n_gen):
+        generation(pop, prob, prof)
+        melhor = float(pop['fitness'][pop['besti']])
+        result['generations'] = geracao + 1
+        result['best_history'].append(melhor)
+        result['average_history'].append(pop['average'])
+
+        if printing:
+            print(f"gen.: {geracao + 1} best: {pop['besti']} best: {melhor:.3f} average: {pop['average']:.3f}")
+
+        if melhor > result['best_fitness']:
+            result['best'] = pop['main'][pop['besti']].copy()
+            result['best_fitness'] = melhor
+            sem_melhoria = 0
+        else:
+            sem_melhoria += 1
+
+        if target is not None and result['best_fitness'] >= target:
+            result['stop_reason'] = 'target'
+            break
+        if patience is not None and sem_melhoria >= patience:
+            result['stop_reason'] = 'patience'
+            break
+        if min_diversity is not None:
+            diversidade = float(np.count_nonzero(pop['main'] != pop['main'][pop['besti']], axis=1).mean())
+            result['diversity_history'].append(diversidade)
+            if diversidade < min_diversity:
+                result['stop_reason'] = 'diversity'
+                break
+        if time_budget is not None and time.perf_counter() - inicio >= time_budget:
+            result['stop_reason'] = 'time_budget'
+            break
+
+    if printing:
+        print(f"Paragem: {result['stop_reason']} ao fim de {result['generations']} geracoes, melhor fitness {result['best_fitness']:.3f}")
+    return result
 
 
           
    
-def make_prob(file, prob):
+def generation(pop, prob, prof=None):
+    """Uma geracao do GA: seleccao, reproducao, substituicao e avaliacao da nova populacao.
+    Com um profiler, o tempo de cada uma das quatro fases e medido separadamente"""
+    if prof is None:
+        select(pop)  
+        reproduce(pop, prob)  
+        replace(pop)  
+        evaluate(pop, prob)
+        return
+
+    prof['count']('generations')
+    with prof['phase']('select'):
+        select(pop)
+    with prof['phase']('reproduce'):
+        reproduce(pop, prob)
+    with prof['phase']('replace'):
+        replace(pop)
+    with prof['phase']('evaluate'):
+        evaluate(pop, prob)
+
+
+def make_prob(file, prob, sidecar=False, printing=True):
     """Funcao que le os dados de um novo problema a partir de um ficheiro de texto file
      Os dados estao no formato: N L \n Peso1 Valor1 \n Peso2 Valor2 \n ... \n PesoN ValorN
-     Devem ser lidos para o dicionario prob a partir do ficheiro file"""
-   
-    prob['pesos'] = []
-    prob['valores'] = []
+     Devem ser lidos para o dicionario prob a partir do ficheiro file.
+     O ficheiro e lido de uma vez e convertido directamente em arrays float64; se o numero de
+     itens nao for N ou alguma linha estiver mal formada e lancado um ValueError que indica a linha.
+     Com sidecar=True e guardada ao lado do ficheiro uma copia binaria (ver prob_cache_path e save_prob)
+     que nas execucoes seguintes e aberta com memory-map, enquanto o conteudo do ficheiro de texto
+     nao mudar. Um ficheiro .npy tambem pode ser passado directamente em file.
+     Com printing=False nao sao impressos N e L"""
    
-    with open(file, 'r') as f:
-        prob['n'] = int(f.readline().strip())
-        prob['l'] = float(f.readline().strip())
+    binario = file if file.endswith('.npy') else None
+    if binario is None:
+        with open(file, 'rb') as f:
+            raw = f.read()
+        if sidecar:
+            binario = prob_cache_path(file, raw)
+    if binario is not None and os.path.exists(binario):
+        data = np.load(binario, mmap_mode='r')
+        prob['n'] = int(data[0, 0])
+        prob['l'] = float(data[1, 0])
+        prob['pesos'] = data[0, 1:]
+        prob['valores'] = data[1, 1:]
+    else:
+        prob['n'], prob['l'], prob['pesos'], prob['valores'] = parse_prob(raw.decode(), file)
+        if sidecar:
+            # Remove as copias binarias de versoes antigas do mesmo ficheiro
+            for antiga in glob.glob(glob.escape(file) + '.*.npy'):
+                os.remove(antiga)
+            save_prob(prob, binario)
         
-        # Imprime n e L
+    # Imprime n e L
+    if printing:
         print(f"Número de itens (N): {prob['n']}")
         print(f"Limite peso (L): {prob['l']}")
 
-
-        # Lê as linhas restantes (itens)
-        for i in range(prob['n']):
-            line = f.readline().strip()
-            peso, valor = map(float, line.split())
-            prob['pesos'].append(peso)
-            prob['valores'].append(valor)  
+    prob.pop('pv', None)
+    prob.pop('ordem', None)
+    item_matrix(prob)
 
     return prob 
+
+
+def parse_prob(text, name='<texto>'):
+    """Converte o texto de um problema em (n, l, pesos, valores), com pesos e valores em arrays
+    contiguos. O caso normal e tratado com um split por linha e uma unica conversao do numpy, que
+    so aceita o texto se o cabecalho (N e L numa linha ou em duas) for seguido de exactamente N linhas
+    com dois campos; quando falha o texto e percorrido outra vez linha a linha, para indicar onde esta o erro"""
+    rows = [campos for campos in map(str.split, text.splitlines()) if campos]
+    try:
+        inicio = 1 if len(rows[0]) == 2 else 2
+        header = rows[0] + rows[1] if inicio == 2 else rows[0]
+        if len(header) == 2:
+            n = int(header[0])
+            l = float(header[1])
+            # Com linhas de tamanhos diferentes np.array falha, pelo que so passam linhas todas com o mesmo
+            # numero de campos, e a forma (n, 2) garante que sao dois
+            items = np.array(rows[inicio:], dtype=np.float64) if len(rows) > inicio else np.empty((0, 2))
+            if items.shape == (n, 2):
+                return n, l, np.ascontiguousarray(items[:, 0]), np.ascontiguousarray(items[:, 1])
+    except (IndexError, ValueError):
+        pass
+    _report_bad_prob(text, name)
+
+
+def _report_bad_prob(text, name):
+    linhas = text.splitlines()
+    header = []
+    for numero, line in enumerate(linhas, 1):
+        header.extend(line.split())
+        if len(header) >= 2:
+            break
+    if len(header) != 2:
+        raise ValueError("%s:%d: cabecalho invalido, esperava 'N L' (numero de itens e limite de peso)" % (name, numero if linhas else 0))
+    try:
+        n = int(header[0])
+        float(header[1])
+    except ValueError:
+        raise ValueError("%s:%d: cabecalho invalido %r, esperava 'N L'" % (name, numero, ' '.join(header))) from None
+
+    itens = 0
+    for numero, line in enumerate(linhas[numero:], numero + 1):
+        campos = line.split()
+        if not campos:
+            continue
+        if len(campos) != 2:
+            raise ValueError("%s:%d: esperava 'peso valor', encontrei %r" % (name, numero, line.strip()))
+        try:
+            float(campos[0]), float(campos[1])
+        except ValueError:
+            raise ValueError("%s:%d: valor nao numerico em %r" % (name, numero, line.strip())) from None
+        itens += 1
+    raise ValueError("%s: o cabecalho indica N=%d itens mas o ficheiro tem %d" % (name, n, itens))
+
+
+def prob_cache_path(file, raw=None):
+    """Caminho da copia binaria de file para o seu conteudo actual (raw, os bytes do ficheiro, se ja
+    tiverem sido lidos): o nome inclui um hash do texto, pelo que uma copia de outra versao do
+    ficheiro nunca e usada, mesmo que seja mais recente (cp -p, git checkout, tar)"""
+    if raw is None:
+        with open(file, 'rb') as f:
+            raw = f.read()
+    return '%s.%s.npy' % (file, hashlib.sha1(raw).hexdigest()[:16])
+
+
+def save_prob(prob, path):
+    """Guarda o problema num ficheiro .npy com uma matriz 2 x (n+1): a primeira coluna tem n e l
+    e as restantes os pesos (primeira linha) e os valores (segunda linha) dos itens"""
+    data = np.empty((2, prob['n'] + 1))
+    data[:, 0] = prob['n'], prob['l']
+    data[0, 1:] = prob['pesos']
+    data[1, 1:] = prob['valores']
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmp, path)
+
+
+def item_matrix(prob):
+    """Matriz n x 2 com o peso e o valor de cada item (prob['pv']), usada para calcular e
+    actualizar os totais dos individuos. E criada na primeira utilizacao se ainda nao existir"""
+    if 'pv' not in prob:
+        prob['pv'] = np.column_stack((prob['pesos'], prob['valores']))
+    return prob['pv']
     
   
    
-def make_pop(pop, pop_size, prob):
+def make_pop(pop, pop_size, prob, seeding=None):
     """ Funcao que recebe uma populacao e cria e inicializa os seus individuos
-    Estes são listas de 0 e 1 de tamanho size armazenadas em pop['main']
+    Estes são linhas de 0 e 1 de tamanho n da matriz pop['main'] (pop_size x n, uint8)
     Para evitar ultrapassar o limite de peso em todos os individuos iniciais, apenas um terço
     dos itens deve ser colocado a 1
-    A lista pop['fitness'] deve ser inicializada a 0 para cada individuo"""    
-    
-    pop['main'] = []
-    pop['fitness'] = []
-    
-    if 'pesos' in prob:
-        num_ones = len(prob['pesos']) // 3  # um terço dos itens deve ser colocado a 1
-        
-        for _ in range(pop_size):
-            ind = [0] * len(prob['pesos'])  # Inicializar o indivíduo com todos os itens não selecionados
-            
+    Com seeding='greedy' (ou a variavel seeding do modulo) cada individuo e construido pelo
+    greedy aleatorizado de greedy_individual, que produz individuos admissiveis e diferentes
+    O array pop['fitness'] deve ser inicializado a 0 para cada individuo"""    
+    
+    seeding = seeding or globals()['seeding']
+    n = len(prob['pesos'])
+    pop['main'] = np.zeros((pop_size, n), dtype=np.uint8)
+    pop['fitness'] = np.zeros(pop_size)
+    pop['tot'] = None  # os totais sao calculados de raiz por evaluate
+    
+    if seeding == 'greedy':
+        for ind in pop['main']:
+            greedy_individual(ind, prob)
+    elif seeding == 'random':
+        num_ones = n // 3  # um terço dos itens deve ser colocado a 1
+        for ind in pop['main']:
             # Selecionar aleatoriamente um terço dos itens para serem 1
-            ones_indices = random.sample(range(len(prob['pesos'])), num_ones)
-            for idx in ones_indices:
-                ind[idx] = 1
-            
-            pop['main'].append(ind)
-            pop['fitness'].append(0)     
+            ind[random.sample(range(n), num_ones)] = 1
+    else:
+        raise ValueError("seeding desconhecido: %r" % (seeding,))
     
+    pop['tot'] = pop['main'] @ item_matrix(prob)
+    if use_repair:
+        repair(pop['main'], pop['tot'], prob)
     evaluate(pop, prob)
 
     # Ordenar os indivíduos com base em sua aptidão, do melhor para o pior
-    pop['main'] = [ind for _, ind in sorted(zip(pop['fitness'], pop['main']), reverse=True)]
-    pop['fitness'] = sorted(pop['fitness'], reverse=True)
+    ordem = np.argsort(-pop['fitness'], kind='stable')
+    pop['main'] = pop['main'][ordem]
+    pop['tot'] = pop['tot'][ordem]
+    pop['fitness'] = pop['fitness'][ordem]
+    pop['besti'] = 0
+
+    # Buffers da populacao temporaria, reutilizados em todas as geracoes
+    pop['temp'] = np.empty_like(pop['main'])
+    pop['temp_tot'] = np.empty_like(pop['tot'])
 
      
      
@@ -154,27 +382,85 @@ def make_pop(pop, pop_size, prob):
 def evaluate(pop, prob):
     
     """ Funcao que executa o ciclo principal de avaliacao no ga.
-    Para cada individuo chama a funcao de avaliacao e armazena
-    o resultado na lista fitness na posicao correspondente ao individuo.
+    O desempenho de cada individuo e obtido a partir dos seus totais de peso e valor
+    (pop['tot']), que os operadores geneticos mantem actualizados de forma incremental;
+    so quando nao existem (populacao nova) sao calculados de raiz com um produto matricial.
+    Se o problema tiver uma funcao de avaliacao propria (prob['fitness_fn'], com a mesma
+    assinatura de fitness) ou a populacao tiver uma cache (pop['cache']), cada individuo e
+    avaliado com essa funcao atraves da cache, para nunca avaliar duas vezes o mesmo genoma.
+    O resultado e armazenado no array fitness na posicao correspondente ao individuo.
     Deve ainda calcular a media do desempenho, que deve ser armazenada
     no campo average da populacao, e guardar a posicao do melhor 
     individuo em pop['besti']. """
    
-   
-    bestFitness = float('-inf') # Melhor aptidão inicializada com -infinito
-    totalFitness = 0  
-    for i, ind in enumerate(pop['main']):
-        fit = fitness(ind, prob)    
-        pop['fitness'] [i] = fit
-        
-        totalFitness += fit
-        
-        if fit > bestFitness:
-            bestFitness = fit
-            pop['besti'] = i
+    if pop.get('tot') is None or len(pop['tot']) != len(pop['main']):
+        pop['tot'] = pop['main'] @ item_matrix(prob)
+
+    if not isinstance(pop.get('fitness'), np.ndarray) or len(pop['fitness']) != len(pop['main']):
+        pop['fitness'] = np.zeros(len(pop['main']))
+
+    fn = prob.get('fitness_fn')
+    if fn is not None or pop.get('cache') is not None:
+        if pop.get('cache') is None:
+            pop['cache'] = make_cache(cache_size or 10000)
+        fn = fn or fitness
+        for i, ind in enumerate(pop['main']):
+            pop['fitness'][i] = cached_fitness(pop['cache'], ind, prob, fn)
+    else:
+        totals_fitness(pop['tot'], prob, out=pop['fitness'])
+    
+    # np.argmax devolve o primeiro melhor, tal como a comparacao estrita fit > bestFitness
+    pop['besti'] = int(np.argmax(pop['fitness']))
      
-     # Calcula a média da aptidão e armazena no campo average da população       
-    pop['average'] = totalFitness / len(pop['main'])
+    # Calcula a média da aptidão e armazena no campo average da população       
+    pop['average'] = float(np.mean(pop['fitness']))
+
+
+def make_cache(max_size):
+    """Cache de fitness limitada a max_size genomas; quando esta cheia e descartado o genoma
+    usado ha mais tempo (LRU). A chave e o genoma com os bits empacotados (np.packbits)"""
+    return {'data': OrderedDict(), 'max_size': max_size, 'hits': 0, 'misses': 0}
+
+
+def cached_fitness(cache, ind, prob, fn=None):
+    """Devolve fn(ind, prob) (por omissao fitness), consultando primeiro a cache"""
+    key = np.packbits(ind).tobytes()
+    data = cache['data']
+    if key in data:
+        cache['hits'] += 1
+        data.move_to_end(key)
+        return data[key]
+
+    cache['misses'] += 1
+    fit = (fn or fitness)(ind, prob)
+    data[key] = fit
+    if len(data) > cache['max_size']:
+        data.popitem(last=False)
+    return fit
+
+
+def cache_stats(cache):
+    total = cache['hits'] + cache['misses']
+    return {'hits': cache['hits'], 'misses': cache['misses'], 'size': len(cache['data']),
+            'hit_rate': cache['hits'] / total if total else 0.0}
+
+
+def pop_fitness(main, prob):
+    """Desempenho de todos os individuos da matriz main (um por linha) com dois produtos
+    matriciais, um pelos pesos e outro pelos valores dos itens. A regra e a mesma de fitness:
+    um individuo acima do limite de peso vale l - pesoTotal"""
+    return totals_fitness(main @ item_matrix(prob), prob)
+
+
+def totals_fitness(tot, prob, out=None):
+    """Desempenho a partir dos totais (peso, valor) de cada individuo; se out for dado
+    o resultado e escrito nesse array em vez de ser criado um novo"""
+    pesoTotal, valorTotal = tot[..., 0], tot[..., 1]
+    if out is None:
+        return np.where(pesoTotal > prob['l'], prob['l'] - pesoTotal, valorTotal)
+    np.subtract(prob['l'], pesoTotal, out=out)
+    np.copyto(out, valorTotal, where=pesoTotal <= prob['l'])
+    return out
             
 
        
@@ -182,39 +468,53 @@ def fitness(ind, prob):
     
     """Funcao de avaliacao: recebe um individuo e devolve uma medida
     real do seu desempenho. Quanto maior o valor melhor é o individuo.
-    ind (dict): Dicionário representando o indivíduo com genes e fitness.
+    ind (array): vector de 0/1 com os itens escolhidos.
         prob (dict): Dicionário representando o problema com informações sobre os itens.
     """
     
-    pesoTotal = 0
-    valorTotal = 0
+    return float(pop_fitness(np.asarray(ind), prob))
     
-    for i, gene  in enumerate(ind):
-        if gene == 1:
-            pesoTotal += prob['pesos'][i]
-            valorTotal += prob['valores'][i]
-    
-    
-    if pesoTotal > prob['l'] :
-        return prob['l'] - pesoTotal
-    
-    return valorTotal
-    
-    
-def select(pop):
-    """Seleccao por torneio de tamanho 3. Tres individuos sao selecionados
-    aleatoriamemte e o melhor é copidado para a populacao de reproducao. O
-    processo e repetido pop_size vezes"""
-    pop['temp'] = []
-    
-    for _ in range(len(pop['main'])):
-        torneio = random.sample(pop['main'], 3)  #Seleciona 3 individos aleatoriamente
-        
-         # Encontra o indivíduo com a maior aptidão (fitness) no torneio
-        melhorInd = max(torneio, key=lambda ind: pop['fitness'][pop['main'].index(ind)])
-       
-        pop['temp'].append(melhorInd)
     
+def select(pop, k=None):
+    """Seleccao por torneio de tamanho k (por omissao tourn_size). Para cada lugar da
+    populacao de reproducao sao sorteados k indices distintos (como random.sample) e o
+    individuo com melhor fitness e copiado para pop['temp']. Todos os torneios sao sorteados
+    de uma vez e decididos consultando directamente o array de fitness, pelo que o custo e
+    linear no tamanho da populacao. Os indices dos vencedores ficam em pop['parents']"""
+    k = tourn_size if k is None else k
+    n = len(pop['main'])
+    if not 1 <= k <= n:
+        raise ValueError("tamanho do torneio invalido: %d (a populacao tem %d individuos)" % (k, n))
+
+    if k * k > n:
+        # Torneios grandes face a populacao: os k primeiros de uma permutacao aleatoria por linha
+        torneios = rng.random((n, n)).argpartition(k - 1, axis=1)[:, :k]
+    else:
+        torneios = rng.integers(0, n, size=(n, k))  # uma linha de k indices por torneio
+        # Os torneios com indices repetidos sao sorteados de novo ate nao haver repeticoes; com k
+        # pequeno face a n sao poucos, e cada linha aceite e uniforme entre as escolhas distintas
+        repetidos = _repeated_rows(torneios)
+        while repetidos.size:
+            torneios[repetidos] = rng.integers(0, n, size=(repetidos.size, k))
+            repetidos = repetidos[_repeated_rows(torneios[repetidos])]
+    melhor = np.argmax(pop['fitness'][torneios], axis=1)
+    pop['parents'] = torneios[np.arange(n), melhor]
+
+    # Os genes dos vencedores sao copiados para o buffer pop['temp'], pelo que cada progenitor
+    # tem a sua propria copia mesmo quando o mesmo individuo e escolhido mais do que uma vez
+    if not isinstance(pop.get('temp'), np.ndarray) or pop['temp'].shape != pop['main'].shape:
+        pop['temp'] = np.empty_like(pop['main'])
+        pop['temp_tot'] = np.empty_like(pop['tot'])
+    np.take(pop['main'], pop['parents'], axis=0, out=pop['temp'])
+    np.take(pop['tot'], pop['parents'], axis=0, out=pop['temp_tot'])
+
+
+def _repeated_rows(a):
+    """Indices das linhas de a que tem algum valor repetido"""
+    ordenado = np.sort(a, axis=1)
+    return np.flatnonzero((ordenado[:, 1:] == ordenado[:, :-1]).any(axis=1))
+
+
 def reproduce(pop, prob):
     """
     Aplica o crossover e mutação a todos os indivíduos da população temporária.
@@ -224,60 +524,153 @@ def reproduce(pop, prob):
     Args:
         pop (dict): Dicionário contendo a população temporária.
     """
-    next_generation = []
-    for i in range(0, len(pop['temp']), 2):  # Itera em passos de dois para formar pares
-        if i + 1 < len(pop['temp']):  
-            ind1, ind2 = pop['temp'][i], pop['temp'][i+1]
+    # Os operadores alteram as linhas de pop['temp'] no proprio array e corrigem os totais
+    # de peso e valor em pop['temp_tot'] apenas com os genes que mudaram
+    pv = item_matrix(prob)
+    temp, tot = pop['temp'], pop['temp_tot']
+    for i in range(0, len(temp), 2):  # Itera em passos de dois para formar pares
+        if i + 1 < len(temp):  
             if random.random() < pc: 
-                ind1, ind2 = crossover_2points(ind1, ind2)
-            ind1 = mutation(ind1)  
-            ind2 = mutation(ind2)  
-            next_generation.extend([ind1, ind2])
-        else:
-            ind1 = mutation(pop['temp'][i])  
-            next_generation.append(ind1)
+                crossover_2points(temp[i], temp[i+1], tot[i], tot[i+1], pv)
+
+    # Mutacao de toda a populacao temporaria de uma so vez
+    mutate_population(temp, tot, pv)
+
+    if use_repair:
+        repair(temp, tot, prob)
+
 
-    pop['temp'] = next_generation  # Atualiza a população temporária com a nova geração
-    evaluate(pop, prob)  # Avaliação da nova população após crossover e mutação
+def ratio_order(prob):
+    """Indices dos itens por ordem decrescente da razao valor/peso, calculados uma vez
+    por problema e guardados em prob['ordem']"""
+    if 'ordem' not in prob:
+        pesos = np.asarray(prob['pesos'], dtype=np.float64)
+        valores = np.asarray(prob['valores'], dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            ratio = np.where(pesos > 0, valores / pesos, np.inf)
+        prob['ordem'] = np.argsort(-ratio, kind='stable')
+    return prob['ordem']
+
+
+def repair(main, tot, prob):
+    """Operador de reparacao: em cada individuo acima do limite de peso retira os itens
+    escolhidos com pior razao valor/peso ate o individuo ser admissivel.
+    Os totais tot sao corrigidos com os itens retirados. Devolve o numero de individuos reparados"""
+    pv = item_matrix(prob)
+    piores_primeiro = ratio_order(prob)[::-1]
+    excesso = np.flatnonzero(tot[:, 0] > prob['l'])
+    for r in excesso:
+        escolhidos = piores_primeiro[main[r, piores_primeiro] == 1]
+        retirado = np.cumsum(pv[escolhidos, 0])
+        # k e o numero minimo de itens a retirar para ficar dentro do limite
+        k = int(np.searchsorted(retirado, tot[r, 0] - prob['l'], side='left')) + 1
+        fora = escolhidos[:k]
+        main[r, fora] = 0
+        tot[r] -= pv[fora].sum(axis=0)
+    return len(excesso)
+
+
+def greedy_individual(ind, prob, noise=None):
+    """Greedy aleatorizado: ordena os itens pela razao valor/peso multiplicada por um ruido
+    aleatorio em [1 - noise, 1 + noise] e junta-os por essa ordem enquanto cabem"""
+    noise = greedy_noise if noise is None else noise
+    pesos = np.asarray(prob['pesos'], dtype=np.float64)
+    valores = np.asarray(prob['valores'], dtype=np.float64)
+    with np.errstate(divide='ignore'):
+        ratio = np.where(pesos > 0, valores / pesos, np.inf)
+    ordem = np.argsort(-ratio * rng.uniform(1 - noise, 1 + noise, len(ratio)), kind='stable')
+
+    # Junta os itens por essa ordem sempre que ainda cabem
+    ind[:] = 0
+    livre = prob['l']
+    for i in ordem:
+        if pesos[i] <= livre:
+            ind[i] = 1
+            livre -= pesos[i]
+    return ind
 
 
                 
-def mutation(ind):
+def mutation(ind, tot=None, pv=None):
     """Aplica mutacao a um individuo com probabilidade pm. Caso haja mutacao
-    um bit e selecionado aleatoriamente e trocado"""
-    for i in range(len(ind)):
-        if random.random() < pm:
-             # Se ocorrer uma mutação, inverte o valor do gene (0 -> 1, 1 -> 0)
-            ind[i] = 1 if ind[i] == 0 else 0
+    um bit e selecionado aleatoriamente e trocado.
+    Em vez de sortear um numero por gene, sorteia a distancia ate ao proximo gene mutado,
+    que segue uma distribuicao geometrica de parametro pm; o resultado e equivalente
+    a decidir gene a gene, mas o custo e proporcional ao numero de mutacoes.
+    Se forem dados os totais tot = [peso, valor] do individuo e a matriz pv de item_matrix,
+    os totais sao corrigidos com o peso e o valor de cada gene trocado"""
+    for i in mutation_loci(len(ind)):
+        # Se ocorrer uma mutação, inverte o valor do gene (0 -> 1, 1 -> 0)
+        ind[i] ^= 1
+        if tot is not None:
+            tot += pv[i] if ind[i] else -pv[i]
     
     return ind
+
+
+def mutation_loci(n):
+    """Posicoes mutadas num vector de n genes, cada uma com probabilidade pm"""
+    if pm <= 0:
+        return []
+    loci = []
+    i = rng.geometric(pm) - 1
+    while i < n:
+        loci.append(i)
+        i += rng.geometric(pm)
+    return loci
+
+
+def mutate_population(main, tot=None, pv=None):
+    """Mutacao de todos os individuos da matriz main de uma so vez. O numero de genes
+    mutados em toda a populacao segue uma binomial (N genes, pm) e as suas posicoes sao
+    sorteadas sem repeticao, o que equivale a decidir cada gene com probabilidade pm.
+    Os totais tot (uma linha por individuo) sao corrigidos como em mutation"""
+    if pm <= 0:
+        return main
+    n = main.shape[1]
+    k = rng.binomial(main.size, min(pm, 1.0))
+    if k == 0:
+        return main
+    loci = rng.choice(main.size, size=k, replace=False)
+    linhas, genes = np.divmod(loci, n)
+
+    main[linhas, genes] ^= 1
+    if tot is not None:
+        # +pv se o gene passou a 1, -pv se passou a 0; add.at porque a mesma linha pode repetir
+        sinal = np.where(main[linhas, genes] == 1, 1.0, -1.0)
+        np.add.at(tot, linhas, sinal[:, None] * pv[genes])
+    return main
             
     
                 
-def crossover_uniforme(ind1, ind2):
+def crossover_uniforme(ind1, ind2, tot1=None, tot2=None, pv=None):
     """Recombinacao uniforme de dois individuos com probabilidade pc. Cada para de bits pode ser 
     trocado nos novos indivudos com 50% de probabilidade"""
     if random.random() < pc:
-        for i in range(len(ind1)):
-            if random.random() < 0.5:
-                ind1[i], ind2[i] = ind2[i], ind1[i]
+        troca = np.array([random.random() < 0.5 for _ in range(len(ind1))])
+        if tot1 is not None:
+            delta = ind2[troca] @ pv[troca] - ind1[troca] @ pv[troca]
+            tot1 += delta
+            tot2 -= delta
+        tmp = ind1[troca]
+        ind1[troca] = ind2[troca]
+        ind2[troca] = tmp
     
     return ind1, ind2
     
     
 
-def crossover_1point(ind1, ind2):
+def crossover_1point(ind1, ind2, tot1=None, tot2=None, pv=None):
     """Recombinacao de um ponto de corte com probabilidade pc"""
     #Verifica se a Recombinação ocorre no ponto de corte
     if random.random() < pc:
         pontocorte = random.randint(1, len(ind1) -1)
-        
-        ind1[pontocorte:], ind2[pontocorte:] = ind2[pontocorte:], ind1[pontocorte:]
+        swap_segment(ind1, ind2, pontocorte, len(ind1), tot1, tot2, pv)
     
     return ind1, ind2
     
 
-def crossover_2points(ind1, ind2):
+def crossover_2points(ind1, ind2, tot1=None, tot2=None, pv=None):
     """Recombinacao de dois ponto de corte com probabilidade pc"""
     
    
@@ -287,23 +680,45 @@ def crossover_2points(ind1, ind2):
         inicio, fim = pontecorte
         
         # Realiza a troca dos genes entre os pontos de corte
-        ind1[inicio:fim], ind2[inicio:fim] = ind2[inicio:fim], ind1[inicio:fim]
+        swap_segment(ind1, ind2, inicio, fim, tot1, tot2, pv)
     
     return ind1, ind2
+
+
+def swap_segment(ind1, ind2, inicio, fim, tot1=None, tot2=None, pv=None):
+    """Troca os genes ind1[inicio:fim] e ind2[inicio:fim]. Se forem dados os totais dos dois
+    individuos, sao corrigidos com a diferenca entre as somas parciais do segmento.
+    Como a soma parcial do segmento e o total menos a soma parcial do resto, e calculada
+    sobre o lado mais curto, o que limita o custo a metade dos genes no pior caso"""
+    if tot1 is not None:
+        if 2 * (fim - inicio) <= len(ind1):
+            delta = ind2[inicio:fim] @ pv[inicio:fim] - ind1[inicio:fim] @ pv[inicio:fim]
+        else:
+            resto1 = ind1[:inicio] @ pv[:inicio] + ind1[fim:] @ pv[fim:]
+            resto2 = ind2[:inicio] @ pv[:inicio] + ind2[fim:] @ pv[fim:]
+            delta = (tot2 - resto2) - (tot1 - resto1)
+        tot1 += delta
+        tot2 -= delta
+
+    # As fatias de um array sao vistas, por isso e preciso copiar uma delas antes da troca
+    tmp = ind1[inicio:fim].copy()
+    ind1[inicio:fim] = ind2[inicio:fim]
+    ind2[inicio:fim] = tmp
    
 
 
 def replace(pop):
     """Substitui a população original pela população temporária.
-    O melhor indivíduo é mantido na posição 0."""
-   
-    pop['main'][0] = pop['main'][pop['besti']].copy()
-    
+    O melhor indivíduo é mantido na posição 0.
+    Em vez de copiar a populacao temporaria, o melhor individuo e copiado para a posicao 0
+    de pop['temp'] e os dois buffers trocam de papel: a populacao antiga passa a ser o
+    buffer onde select escreve os progenitores da geracao seguinte"""
    
-    pop['main'][1:] = pop['temp'][1:]
+    pop['temp'][0] = pop['main'][pop['besti']]
+    pop['temp_tot'][0] = pop['tot'][pop['besti']]
     
-    # Limpa a população temporária
-    pop['temp'] = []
+    pop['main'], pop['temp'] = pop['temp'], pop['main']
+    pop['tot'], pop['temp_tot'] = pop['temp_tot'], pop['tot']
     
     
 
@@ -0,0 +1,158 @@
+"""Modelo de ilhas para o GA da mochila.
+
+Cada ilha e uma populacao independente, a correr num processo proprio, que evolui com o
+mesmo ciclo select/reproduce/replace/evaluate de backpack_alunos.py (generation).
+De migration_interval em migration_interval geracoes as ilhas param, enviam ao processo
+principal os seus n_migrants melhores individuos e recebem os migrantes que lhes cabem
+segundo a topologia escolhida; os migrantes substituem os piores individuos da ilha.
+
+Topologias:
+    'ring'    a ilha i recebe os migrantes da ilha i-1
+    'full'    cada ilha recebe os melhores de entre os migrantes de todas as outras
+    'random'  cada ilha recebe os migrantes de outra ilha sorteada em cada migracao
+
+A ilha i usa a semente seed + i e as migracoes sao sincronas (e o sorteio da topologia
+'random' usa a semente seed), pelo que uma execucao e reproduzivel.
+
+Exemplo:
+    python islands.py prob3.txt --islands 8 --generations 200
+"""
+
+import argparse
+import multiprocessing as mp
+import random
+
+import numpy as np
+
+import backpack_alunos as ga
+
+topologies = ('ring', 'full', 'random')
+
+
+def _island(conn, prob, pop_size, seed):
+    ga.seed(seed)
+    pop = {}
+    ga.make_pop(pop, pop_size, prob)
+
+    while True:
+        msg = conn.recv()
+        if msg[0] == 'stop':
+            break
+        _, migrants, n_gen, n_migrants = msg
+
+        if migrants is not None:
+            immigrate(pop, prob, migrants)
+        for _ in range(n_gen):
+            ga.generation(pop, prob)
+
+        conn.send((best_individuals(pop, n_migrants), pop['average']))
+    conn.close()
+
+
+def best_individuals(pop, k):
+    """Os k melhores individuos da populacao (genes, fitness), do melhor para o pior"""
+    ordem = np.argsort(-pop['fitness'], kind='stable')[:k]
+    return pop['main'][ordem].copy(), pop['fitness'][ordem].copy()
+
+
+def immigrate(pop, prob, migrants):
+    """Os migrantes substituem os piores individuos da populacao (o melhor, na posicao 0, nunca e substituido)"""
+    genes, _ = migrants
+    piores = np.argsort(pop['fitness'], kind='stable')
+    piores = piores[piores != 0][:len(genes)]
+    pop['main'][piores] = genes[:len(piores)]
+    pop['tot'][piores] = genes[:len(piores)] @ ga.item_matrix(prob)
+    ga.evaluate(pop, prob)
+
+
+def route(emigrants, topology, rng):
+    """Decide que migrantes recebe cada ilha; emigrants[i] e o par (genes, fitness) da ilha i"""
+    n = len(emigrants)
+    if n == 1:
+        return [None]
+    if topology == 'ring':
+        return [emigrants[i - 1] for i in range(n)]
+    if topology == 'random':
+        return [emigrants[rng.choice([j for j in range(n) if j != i])] for i in range(n)]
+    if topology == 'full':
+        routed = []
+        for i in range(n):
+            genes = np.concatenate([emigrants[j][0] for j in range(n) if j != i])
+            fits = np.concatenate([emigrants[j][1] for j in range(n) if j != i])
+            ordem = np.argsort(-fits, kind='stable')[:len(emigrants[i][0])]
+            routed.append((genes[ordem], fits[ordem]))
+        return routed
+    raise ValueError("topologia desconhecida: %r (esperada uma de %s)" % (topology, ', '.join(topologies)))
+
+
+def run_islands(prob, n_islands=4, pop_size=20, n_gen=100, migration_interval=10, n_migrants=2,
+                topology='ring', seed=0, printing=True):
+    """Corre o modelo de ilhas durante n_gen geracoes e devolve um dicionario com o melhor
+    individuo global ('best', 'best_fitness', 'island') e, por migracao, o melhor fitness
+    de cada ilha ('history')."""
+    if topology not in topologies:
+        raise ValueError("topologia desconhecida: %r (esperada uma de %s)" % (topology, ', '.join(topologies)))
+    rng = random.Random(seed)
+    pipes, processes = [], []
+    for i in range(n_islands):
+        parent, child = mp.Pipe()
+        p = mp.Process(target=_island, args=(child, prob, pop_size, seed + i), daemon=True)
+        p.start()
+        pipes.append(parent)
+        processes.append(p)
+
+    result = {'best': None, 'best_fitness': float('-inf'), 'island': None, 'history': []}
+    incoming = [None] * n_islands
+    feitas = 0
+    try:
+        while feitas < n_gen:
+            passo = min(migration_interval, n_gen - feitas)
+            for conn, migrants in zip(pipes, incoming):
+                conn.send(('run', migrants, passo, n_migrants))
+            replies = [conn.recv() for conn in pipes]
+            feitas += passo
+
+            emigrants = [r[0] for r in replies]
+            result['history'].append([float(e[1][0]) for e in emigrants])
+            for i, (genes, fits) in enumerate(emigrants):
+                if fits[0] > result['best_fitness']:
+                    result.update(best=genes[0].copy(), best_fitness=float(fits[0]), island=i)
+
+            if printing:
+                print("gen.: {} best: {:.3f} (ilha {}) islands: {}".format(
+                    feitas, result['best_fitness'], result['island'],
+                    ' '.join('%.3f' % f for f in result['history'][-1])))
+
+            incoming = route(emigrants, topology, rng)
+    finally:
+        for conn in pipes:
+            # uma ilha que ja morreu nao pode receber a mensagem; o erro original e que deve ser visto
+            try:
+                conn.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+        for p in processes:
+            p.join()
+
+    result['generations'] = feitas
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('prob_file')
+    parser.add_argument('--islands', type=int, default=4)
+    parser.add_argument('--pop-size', type=int, default=ga.pop_size)
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--interval', type=int, default=10)
+    parser.add_argument('--migrants', type=int, default=2)
+    parser.add_argument('--topology', choices=topologies, default='ring')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    prob = {'n': 0, 'l': 0, 'pesos': [], 'valores': []}
+    ga.make_prob(args.prob_file, prob)
+    res = run_islands(prob, args.islands, args.pop_size, args.generations, args.interval,
+                      args.migrants, args.topology, args.seed)
+    print("Melhor fitness global: {:.3f} (ilha {}, {} itens)".format(
+        res['best_fitness'], res['island'], int(res['best'].sum())))
@@ -0,0 +1,242 @@
+"""Solvers de referencia para o problema da mochila, para medir a qualidade e a rapidez do GA.
+
+Todos recebem o mesmo dicionario prob que o GA (ver make_prob em backpack_alunos.py) e
+devolvem um dicionario com 'genes' (vector 0/1 pela ordem original dos itens), 'valor',
+'peso' e, quando se aplica, 'optimo' (True se a solucao e garantidamente optima) e 'bound'
+(majorante do valor optimo).
+
+    greedy             escolhe os itens por ordem decrescente de valor/peso enquanto cabem
+    dynamic            programacao dinamica sobre os pesos arredondados para cima numa grelha
+                       de resolution unidades; a solucao e sempre admissivel e e optima quando
+                       os pesos sao multiplos de l / resolution (para instancias pequenas)
+    branch_and_bound   pesquisa em profundidade com o majorante fraccionario (greedy com o
+                       ultimo item partido); exacto, com um limite opcional de nos
+
+O bloco __main__ corre os tres solvers e o GA sobre os ficheiros indicados e mostra o
+desvio do GA face ao melhor valor conhecido e o tempo que o GA levou a atingir o alvo,
+para o GA base e para as variantes com reparacao (use_repair) e/ou populacao inicial
+gerada pelo greedy aleatorizado (seeding='greedy').
+
+Exemplo:
+    python solver.py prob1.txt prob2.txt prob3.txt --generations 200
+"""
+
+import argparse
+import bisect
+import time
+
+import numpy as np
+
+import backpack_alunos as ga
+
+
+def _solution(prob, escolhidos, **extra):
+    genes = np.zeros(len(prob['pesos']), dtype=np.uint8)
+    genes[list(escolhidos)] = 1
+    sol = {'genes': genes, 'valor': float(genes @ prob['valores']), 'peso': float(genes @ prob['pesos'])}
+    sol.update(extra)
+    return sol
+
+
+def greedy(prob):
+    l = prob['l']
+    peso = 0.0
+    escolhidos = []
+    for i in ga.ratio_order(prob):
+        if peso + prob['pesos'][i] <= l:
+            peso += prob['pesos'][i]
+            escolhidos.append(i)
+    return _solution(prob, escolhidos, optimo=False)
+
+
+def dynamic(prob, resolution=10000):
+    """Programacao dinamica com a capacidade dividida em resolution unidades. Cada peso e
+    arredondado para cima, pelo que qualquer solucao encontrada respeita o limite real.
+    Memoria e tempo O(n * resolution)"""
+    l = prob['l']
+    escala = resolution / l
+    w = np.ceil(np.asarray(prob['pesos']) * escala - 1e-9).astype(np.int64)
+    v = np.asarray(prob['valores'], dtype=np.float64)
+    n = len(w)
+
+    best = np.zeros(resolution + 1)  # best[c] = melhor valor com capacidade c
+    escolha = np.zeros((n, resolution + 1), dtype=bool)
+    for i in range(n):
+        if w[i] > resolution:
+            continue
+        com = best[:resolution + 1 - w[i]] + v[i]
+        melhora = com > best[w[i]:]
+        escolha[i, w[i]:] = melhora
+        best[w[i]:] = np.where(melhora, com, best[w[i]:])
+
+    # Reconstroi a solucao a partir da capacidade total
+    c = resolution
+    escolhidos = []
+    for i in range(n - 1, -1, -1):
+        if escolha[i, c]:
+            escolhidos.append(i)
+            c -= w[i]
+    exacto = np.allclose(np.asarray(prob['pesos']) * escala, w)
+    return _solution(prob, escolhidos, optimo=bool(exacto))
+
+
+def branch_and_bound(prob, node_limit=None):
+    """Branch-and-bound em profundidade sobre os itens ordenados por valor/peso.
+    O majorante de cada no junta os itens seguintes enquanto cabem e uma fraccao do
+    primeiro que nao cabe; com as somas acumuladas dos pesos e valores ordenados esse
+    ponto e encontrado por pesquisa binaria. Se node_limit for atingido devolve a melhor
+    solucao encontrada com optimo=False e o majorante global em 'bound'"""
+    ordem = ga.ratio_order(prob)
+    w = [float(prob['pesos'][i]) for i in ordem]
+    v = [float(prob['valores'][i]) for i in ordem]
+    n = len(w)
+    cap = float(prob['l'])
+
+    W = [0.0]
+    V = [0.0]
+    for peso, valor in zip(w, v):
+        W.append(W[-1] + peso)
+        V.append(V[-1] + valor)
+
+    def bound(k, cw, cv):
+        # j e o primeiro item (a partir de k) que ja nao cabe inteiro
+        j = bisect.bisect_right(W, cap - cw + W[k], k) - 1
+        b = cv + V[j] - V[k]
+        if j < n and w[j] > 0:
+            b += (cap - cw - (W[j] - W[k])) * v[j] / w[j]
+        return b
+
+    inicial = greedy(prob)
+    best_v = inicial['valor']
+    best_sel = None
+    raiz = bound(0, 0.0, 0.0)
+
+    # Cada no e (proximo item, peso, valor, itens escolhidos como lista ligada (item, resto))
+    stack = [(0, 0.0, 0.0, None)]
+    nos = 0
+    completo = True
+    while stack:
+        if node_limit is not None and nos >= node_limit:
+            completo = False
+            break
+        k, cw, cv, sel = stack.pop()
+        nos += 1
+        if cv > best_v:
+            best_v, best_sel = cv, sel
+        if k == n or bound(k, cw, cv) <= best_v + 1e-12:
+            continue
+        # Explora primeiro o ramo em que o item k entra (fica no topo da pilha)
+        stack.append((k + 1, cw, cv, sel))
+        if cw + w[k] <= cap:
+            stack.append((k + 1, cw + w[k], cv + v[k], (k, sel)))
+
+    if best_sel is None:
+        sol = dict(inicial)
+    else:
+        escolhidos = []
+        while best_sel is not None:
+            escolhidos.append(ordem[best_sel[0]])
+            best_sel = best_sel[1]
+        sol = _solution(prob, escolhidos)
+    sol.update(optimo=completo, bound=sol['valor'] if completo else raiz, nos=nos)
+    return sol
+
+
+# Variantes do GA comparadas no benchmark: (use_repair, seeding)
+ga_variants = {'ga': (False, 'random'),
+               'ga+repair': (True, 'random'),
+               'ga+greedy': (False, 'greedy'),
+               'ga+repair+greedy': (True, 'greedy')}
+
+
+def ga_trace(prob, n_gen, pop_size=None, seed=0, repair=False, seeding='random'):
+    """Corre o GA sem graficos nem mensagens e devolve o melhor individuo final e, por
+    geracao, o melhor fitness e o tempo decorrido"""
+    anterior = ga.use_repair
+    ga.use_repair = repair
+    try:
+        ga.seed(seed)
+        pop = {}
+        inicio = time.perf_counter()
+        ga.make_pop(pop, pop_size or ga.pop_size, prob, seeding)
+        melhores, tempos = [], []
+        for _ in range(n_gen):
+            ga.generation(pop, prob)
+            melhores.append(float(pop['fitness'][pop['besti']]))
+            tempos.append(time.perf_counter() - inicio)
+    finally:
+        ga.use_repair = anterior
+    return {'genes': pop['main'][pop['besti']].copy(), 'best': melhores, 'time': tempos}
+
+
+def time_to_target(trace, target):
+    """Tempo (e geracao) em que o GA atingiu pela primeira vez target; None se nunca atingiu"""
+    for geracao, (fit, t) in enumerate(zip(trace['best'], trace['time']), 1):
+        if fit >= target:
+            return t, geracao
+    return None
+
+
+def timed(fn, *args, **kwargs):
+    inicio = time.perf_counter()
+    res = fn(*args, **kwargs)
+    res['tempo'] = time.perf_counter() - inicio
+    return res
+
+
+def benchmark(prob, n_gen=200, pop_size=None, seed=0, target=0.99, node_limit=2000000, resolution=10000):
+    """Corre os solvers e o GA sobre prob e devolve um dicionario com os resultados.
+    O alvo do GA e a fraccao target do melhor valor encontrado pelos solvers"""
+    res = {'greedy': timed(greedy, prob),
+           'branch_and_bound': timed(branch_and_bound, prob, node_limit=node_limit)}
+    if len(prob['pesos']) * resolution <= 50_000_000:
+        res['dynamic'] = timed(dynamic, prob, resolution)
+
+    referencia = max(r['valor'] for r in res.values())
+    for nome, (repair, seeding) in ga_variants.items():
+        trace = ga_trace(prob, n_gen, pop_size, seed, repair, seeding)
+        ga_best = max(trace['best'])
+        res[nome] = {'valor': ga_best, 'tempo': trace['time'][-1],
+                     'gap': (referencia - ga_best) / referencia if referencia else 0.0,
+                     'time_to_target': time_to_target(trace, target * referencia)}
+    res['referencia'] = referencia
+    res['optimo'] = res['branch_and_bound']['optimo']
+    return res
+
+
+def print_benchmark(nome, res, target):
+    print("-" * 62)
+    print("| {:<56} |".format("%s  (melhor conhecido: %.4f%s)" % (
+        nome, res['referencia'], ', optimo' if res['optimo'] else '')))
+    print("-" * 62)
+    print("| {:<18} | {:>12} | {:>10} | {:>8} |".format("Metodo", "Valor", "Tempo(s)", "Gap"))
+    for metodo in ('greedy', 'dynamic', 'branch_and_bound') + tuple(ga_variants):
+        if metodo in res:
+            r = res[metodo]
+            gap = (res['referencia'] - r['valor']) / res['referencia'] if res['referencia'] else 0.0
+            print("| {:<18} | {:>12.4f} | {:>10.4f} | {:>7.2%} |".format(metodo, r['valor'], r['tempo'], gap))
+    for nome in ga_variants:
+        ttt = res[nome]['time_to_target']
+        if ttt is None:
+            print("%s nao atingiu %.0f%% do melhor valor conhecido" % (nome, 100 * target))
+        else:
+            print("%s atingiu %.0f%% do melhor valor conhecido em %.4fs (geracao %d)" % (nome, 100 * target, ttt[0], ttt[1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('prob_files', nargs='+')
+    parser.add_argument('--generations', type=int, default=200)
+    parser.add_argument('--pop-size', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--target', type=float, default=0.99)
+    parser.add_argument('--node-limit', type=int, default=2000000)
+    parser.add_argument('--resolution', type=int, default=10000)
+    args = parser.parse_args()
+
+    for prob_file in args.prob_files:
+        prob = {'n': 0, 'l': 0, 'pesos': [], 'valores': []}
+        ga.make_prob(prob_file, prob)
+        res = benchmark(prob, args.generations, args.pop_size, args.seed, args.target,
+                        args.node_limit, args.resolution)
+        print_benchmark(prob_file, res, args.target)
@@ -0,0 +1,219 @@
+"""Benchmark dos caminhos criticos do GA da mochila e da rede neuronal dos cogumelos.
+
+Mede, com sementes fixas, o debito (chamadas por segundo) de:
+    GA   fitness, evaluate, select e reproduce em prob1-3 e em instancias sinteticas
+         de 10 000 e 100 000 itens
+    NN   forward, iterate, iterate_sparse e test_mushrooms sobre mushrooms.csv, para varios tamanhos
+         da camada escondida e para os dois backends (listas e numpy)
+    ACT  os modos de activacao de nn_alunos (exact, clip): debito de forward/iterate_sparse
+         e de predict_many, erro maximo face a sigmoide exacta e precisao de teste depois
+         de um treino com a mesma semente
+
+Os resultados sao escritos em JSON para poderem ser comparados entre versoes:
+    python benchmark.py --out antes.json
+    ... alteracoes ...
+    python benchmark.py --out depois.json --compare antes.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GA_DIR = os.path.join(HERE, 'AlgoritmoGenetico')
+NN_DIR = os.path.join(HERE, 'AgentesAprendizes')
+sys.path[:0] = [GA_DIR, NN_DIR]
+
+import backpack_alunos as ga  # noqa: E402
+import nn_alunos as nn  # noqa: E402
+
+
+def measure(fn, setup=None, min_time=0.2, min_calls=3, max_calls=100000):
+    """Chama fn repetidamente durante pelo menos min_time segundos (e min_calls vezes) e
+    devolve o numero de chamadas e o tempo medio por chamada. setup, se indicado, e chamado
+    antes de cada chamada e o seu tempo nao e contado"""
+    total = 0.0
+    calls = 0
+    while (total < min_time or calls < min_calls) and calls < max_calls:
+        if setup is not None:
+            setup()
+        inicio = time.perf_counter()
+        fn()
+        total += time.perf_counter() - inicio
+        calls += 1
+    return {'calls': calls, 'total_s': total, 'mean_s': total / calls, 'per_sec': calls / total}
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def synthetic_prob(n, seed=0):
+    """Instancia aleatoria com pesos e valores uniformes em [0, 1) e limite n / 8 (como prob1-3)"""
+    r = np.random.default_rng(seed)
+    prob = {'n': n, 'l': n / 8, 'pesos': r.random(n), 'valores': r.random(n)}
+    ga.item_matrix(prob)
+    return prob
+
+
+def ga_instances(sizes):
+    instances = []
+    for nome in ('prob1.txt', 'prob2.txt', 'prob3.txt'):
+        prob = {}
+        ga.make_prob(os.path.join(GA_DIR, nome), prob, printing=False)
+        instances.append((nome[:-4], prob))
+    for n in sizes:
+        instances.append(('synthetic%d' % n, synthetic_prob(n)))
+    return instances
+
+
+def bench_ga(sizes, pop_size, min_time, seed=0):
+    results = []
+    for nome, prob in ga_instances(sizes):
+        ga.seed(seed)
+        pop = {}
+        ga.make_pop(pop, pop_size, prob)
+        ind = pop['main'][0].copy()
+
+        def add(op, m):
+            results.append(dict(name='ga.' + op, instance=nome, n=int(prob['n']), pop_size=pop_size, **m))
+
+        add('fitness', measure(lambda: ga.fitness(ind, prob), min_time=min_time))
+        add('evaluate', measure(lambda: ga.evaluate(pop, prob), min_time=min_time))
+        add('select', measure(lambda: ga.select(pop), min_time=min_time))
+        add('reproduce', measure(lambda: ga.reproduce(pop, prob), setup=lambda: ga.select(pop), min_time=min_time))
+        add('generation', measure(lambda: ga.generation(pop, prob), min_time=min_time))
+    return results
+
+
+def bench_nn(hidden_sizes, min_time, seed=0):
+    results = []
+    csv_file = os.path.join(NN_DIR, 'mushrooms.csv')
+    random.seed(seed)
+    train_set, test_set = quiet(nn.build_sets, csv_file, 1000, 1000)
+    pattern = train_set[0]
+    idx = nn.active_indices([pattern[0]])[0].tolist()
+
+    for backend in ('list', 'numpy'):
+        for hidden in hidden_sizes:
+            random.seed(seed)
+            net = nn.make(len(pattern[0]), hidden, 2, backend)
+
+            def add(op, m):
+                results.append(dict(name='nn.' + op, backend=backend, hidden=hidden, **m))
+
+            add('forward', measure(lambda: nn.forward(net, pattern[0]), min_time=min_time))
+            add('iterate', measure(lambda: nn.iterate(0, net, pattern[0], pattern[2], printing=False), min_time=min_time))
+            add('iterate_sparse', measure(lambda: nn.iterate_sparse(net, idx, pattern[2]), min_time=min_time))
+            m = measure(lambda: nn.test_mushrooms(net, test_set, printing=False), min_time=min_time)
+            m['patterns_per_sec'] = m['per_sec'] * len(test_set)
+            add('test_mushrooms', m)
+    return results
+
+
+def bench_activations(hidden, min_time, seed=0, modes=('exact', 'clip')):
+    results = []
+    csv_file = os.path.join(NN_DIR, 'mushrooms.csv')
+    random.seed(seed)
+    train_set, test_set = quiet(nn.build_sets, csv_file, 2000, 1000)
+    pattern = train_set[0]
+    idx = nn.active_indices([pattern[0]])[0].tolist()
+    X_test, T_test = nn.patterns_to_arrays(test_set)
+    xs = np.linspace(-20, 20, 4001)
+
+    try:
+        for mode in modes:
+            nn.set_activation(mode)
+            random.seed(seed)
+            net = nn.make(len(pattern[0]), hidden, 2)
+            net_np = nn.make(len(pattern[0]), hidden, 2, 'numpy')
+            random.seed(seed)
+            trained = nn.train_mushrooms(len(pattern[0]), hidden, 2, train_set, test_set, 2, 10, headless=True, sparse=True)
+            extra = {'max_error': float(np.abs(nn.sig_np(xs) - nn._sig_np_exact(xs)).max()),
+                     'test_accuracy': nn.accuracy_many(trained, X_test, T_test)}
+
+            def add(op, m):
+                results.append(dict(name='act.' + op, activation=mode, hidden=hidden, **m, **extra))
+
+            add('forward', measure(lambda: nn.forward(net, pattern[0]), min_time=min_time))
+            add('iterate_sparse', measure(lambda: nn.iterate_sparse(net, idx, pattern[2]), min_time=min_time))
+            add('predict_many', measure(lambda: nn.predict_many(net_np, X_test), min_time=min_time))
+    finally:
+        nn.set_activation()
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def key(r):
+    return tuple((k, r[k]) for k in ('name', 'instance', 'backend', 'activation', 'hidden', 'pop_size') if k in r)
+
+
+def compare(results, baseline):
+    """Mostra a razao entre o debito actual e o de uma execucao anterior (>1 e mais rapido)"""
+    antes = {key(r): r for r in baseline['results']}
+    print("| {:<45} | {:>12} | {:>12} | {:>7} |".format('benchmark', 'antes (/s)', 'agora (/s)', 'razao'))
+    for r in results:
+        b = antes.get(key(r))
+        if b is not None:
+            nome = ' '.join(str(v) for _, v in key(r))
+            print("| {:<45} | {:>12.1f} | {:>12.1f} | {:>6.2f}x |".format(nome, b['per_sec'], r['per_sec'], r['per_sec'] / b['per_sec']))
+
+
+def run(sizes=(10000, 100000), pop_size=None, hidden_sizes=(4, 7, 11), min_time=0.2, seed=0, only=None):
+    results = []
+    if only in (None, 'ga'):
+        results += bench_ga(sizes, pop_size or ga.pop_size, min_time, seed)
+    if only in (None, 'nn'):
+        results += bench_nn(hidden_sizes, min_time, seed)
+    if only in (None, 'act'):
+        results += bench_activations(max(hidden_sizes), min_time, seed)
+    return {'meta': metadata(), 'results': results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='JSON', help='resultado anterior para comparar')
+    parser.add_argument('--only', choices=['ga', 'nn', 'act'])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000])
+    parser.add_argument('--pop-size', type=int, default=None)
+    parser.add_argument('--hidden', type=int, nargs='+', default=[4, 7, 11])
+    parser.add_argument('--min-time', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.pop_size, args.hidden, args.min_time, args.seed, args.only)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for r in report['results']:
+        nome = ' '.join(str(v) for _, v in key(r))
+        linha = "{:<45} {:>12.1f}/s  {:>10.6f}s".format(nome, r['per_sec'], r['mean_s'])
+        if 'test_accuracy' in r:
+            linha += "  erro max {:.1e}  precisao {:.2f}%".format(r['max_error'], r['test_accuracy'])
+        print(linha)
+    print("Resultados guardados em", args.out)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report['results'], json.load(f))
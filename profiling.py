@@ -0,0 +1,131 @@
+"""Instrumentacao opcional por fases para o GA e para a rede neuronal.
+
+Um profiler e um dicionario com contadores e tempos por fase e duas funcoes:
+    prof['phase'](nome)     gestor de contexto que mede o tempo passado dentro do bloco
+    prof['count'](nome, n)  soma n ao contador nome
+
+As funcoes instrumentadas (run_ga, evolve e generation em backpack_alunos.py; run_mushrooms
+e train_mushrooms em nn_alunos.py) recebem um argumento prof=None e, quando e None, nao
+medem nada. As fases podem estar encaixadas umas nas outras; o resumo mostra o tempo total
+de cada fase e o tempo proprio (sem as fases interiores).
+
+Para alem disso, capture corre uma funcao dentro do cProfile e mostra as funcoes mais pesadas.
+
+Exemplo:
+    python profiling.py ga AlgoritmoGenetico/prob3.txt --generations 500
+    python profiling.py nn --hidden 11 --epochs 5 --train 6000 --cprofile nn.prof
+"""
+
+import argparse
+import cProfile
+import contextlib
+import io
+import os
+import pstats
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_profiler():
+    prof = {'total': {}, 'self': {}, 'calls': {}, 'counters': {}, 'stack': []}
+
+    @contextlib.contextmanager
+    def phase(nome):
+        # cada entrada da pilha guarda o tempo gasto nas fases interiores
+        prof['stack'].append(0.0)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            decorrido = time.perf_counter() - inicio
+            interior = prof['stack'].pop()
+            if prof['stack']:
+                prof['stack'][-1] += decorrido
+            prof['total'][nome] = prof['total'].get(nome, 0.0) + decorrido
+            prof['self'][nome] = prof['self'].get(nome, 0.0) + decorrido - interior
+            prof['calls'][nome] = prof['calls'].get(nome, 0) + 1
+
+    def count(nome, n=1):
+        prof['counters'][nome] = prof['counters'].get(nome, 0) + n
+
+    prof['phase'] = phase
+    prof['count'] = count
+    return prof
+
+
+def summary(prof):
+    """Lista de (fase, chamadas, tempo total, tempo proprio), da fase com mais tempo proprio para a com menos"""
+    linhas = [(nome, prof['calls'][nome], prof['total'][nome], prof['self'][nome]) for nome in prof['total']]
+    return sorted(linhas, key=lambda l: -l[3])
+
+
+def print_summary(prof, file=None):
+    linhas = summary(prof)
+    proprio = sum(l[3] for l in linhas) or 1.0
+    print("| {:<20} | {:>9} | {:>10} | {:>10} | {:>6} |".format('fase', 'chamadas', 'total(s)', 'proprio(s)', '%'), file=file)
+    for nome, calls, total, self_time in linhas:
+        print("| {:<20} | {:>9} | {:>10.4f} | {:>10.4f} | {:>5.1f}% |".format(
+            nome, calls, total, self_time, 100 * self_time / proprio), file=file)
+    for nome, valor in sorted(prof['counters'].items()):
+        print("{}: {}".format(nome, valor), file=file)
+
+
+def capture(fn, *args, out=None, sort='cumulative', top=25, **kwargs):
+    """Corre fn(*args, **kwargs) dentro do cProfile, mostra as top funcoes ordenadas por sort
+    e, se out for indicado, guarda as estatisticas nesse ficheiro (para snakeviz, pstats, ...)"""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(fn, *args, **kwargs)
+    if out:
+        profiler.dump_stats(out)
+    texto = io.StringIO()
+    pstats.Stats(profiler, stream=texto).sort_stats(sort).print_stats(top)
+    print(texto.getvalue())
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='alvo', required=True)
+    p_ga = sub.add_parser('ga', help='corre run_ga instrumentado')
+    p_ga.add_argument('prob_file')
+    p_ga.add_argument('--generations', type=int, default=None)
+    p_nn = sub.add_parser('nn', help='corre run_mushrooms instrumentado')
+    p_nn.add_argument('--csv', default=os.path.join(HERE, 'AgentesAprendizes', 'mushrooms.csv'))
+    p_nn.add_argument('--hidden', type=int, default=11)
+    p_nn.add_argument('--epochs', type=int, default=2)
+    p_nn.add_argument('--train', type=int, default=1000)
+    p_nn.add_argument('--test', type=int, default=1000)
+    p_nn.add_argument('--batch-size', type=int, default=1)
+    p_nn.add_argument('--sparse', action='store_true', help='treino com entradas esparsas (indices activos)')
+    p_nn.add_argument('--snapshots', type=int, default=10, help='medicoes da precisao durante o treino (0 desliga)')
+    for p in (p_ga, p_nn):
+        p.add_argument('--cprofile', metavar='FICHEIRO', nargs='?', const='', default=None,
+                       help='corre tambem dentro do cProfile (e guarda as estatisticas em FICHEIRO)')
+    args = parser.parse_args()
+
+    prof = make_profiler()
+    if args.alvo == 'ga':
+        sys.path.insert(0, os.path.join(HERE, 'AlgoritmoGenetico'))
+        import backpack_alunos as ga
+        if args.generations:
+            ga.n_gen = args.generations
+        fn, fargs, fkwargs = ga.run_ga, (args.prob_file,), {'printing': False, 'plot': False, 'prof': prof}
+    else:
+        sys.path.insert(0, os.path.join(HERE, 'AgentesAprendizes'))
+        import metrics
+        import nn_alunos as nn
+        fn, fargs = nn.run_mushrooms, (args.csv, 126, args.hidden, 2, args.epochs, args.train, args.test, 10)
+        recorder = None
+        if args.snapshots:
+            every = max(1, args.train * args.epochs // args.snapshots)
+            recorder = metrics.make_recorder([metrics.stdout_sink()], every=every)
+        fkwargs = {'batch_size': args.batch_size, 'headless': True, 'recorder': recorder, 'prof': prof,
+                   'sparse': args.sparse}
+
+    if args.cprofile is not None:
+        capture(fn, *fargs, out=args.cprofile or None, **fkwargs)
+    else:
+        fn(*fargs, **fkwargs)
+    print_summary(prof)